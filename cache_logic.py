@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import resume_logic
+from plan_logic import format_bytes
+
+INDEX_FILENAME = "cache_index.json"
+DEFAULT_CACHE_MAX_GB = 20
+# Linux FICLONE ioctl: a copy-on-write clone on filesystems that support it (btrfs, XFS).
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are only attempted on Linux.")
+    import fcntl
+    with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+        fcntl.ioctl(dst_f.fileno(), _FICLONE, src_f.fileno())
+
+def clone_or_copy(src, dst):
+    """
+    Makes dst an independent copy of src, by reflink where the filesystem supports it,
+    otherwise a plain copy. Never a hardlink: editing one file must not change the
+    other. The result appears at dst atomically and replaces any existing file.
+    """
+    temp_path = resume_logic.part_path(dst)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        _reflink(src, temp_path)
+        method = "reflink"
+    except OSError:
+        shutil.copyfile(src, temp_path)
+        method = "copy"
+    os.replace(temp_path, dst)
+    return method
+
+class ContentCache:
+    """
+    A local store of downloaded SharePoint files shared across jobs. Entries are keyed
+    by server-relative URL plus ETag (or modified time), so a changed file is never
+    served stale, and the least recently used entries are evicted above max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+        # Copies into the cache run here rather than on the caller's thread.
+        self._adder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CacheAdd")
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+
+    @staticmethod
+    def make_key(server_relative_url, version):
+        return hashlib.sha256(f"{server_relative_url.lower()}|{version}".encode("utf-8")).hexdigest()
+
+    def _blob_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def lookup(self, key):
+        """Returns the size of the cached copy for key, or None on a cache miss."""
+        with self.lock:
+            entry = self.index.get(key)
+            blob_path = self._blob_path(key)
+            if entry is None or not os.path.exists(blob_path) or os.path.getsize(blob_path) != entry["size"]:
+                self.index.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["size"]
+
+    def materialise(self, key, local_file_path):
+        """Places the cached copy for key at local_file_path and returns its size."""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                raise FileNotFoundError(f"'{local_file_path}' is no longer in the download cache.")
+            clone_or_copy(self._blob_path(key), local_file_path)
+            entry["last_used"] = time.time()
+            self.bytes_from_cache += entry["size"]
+            return entry["size"]
+
+    def add(self, key, local_file_path, server_relative_url):
+        size = os.path.getsize(local_file_path)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            blob_path = self._blob_path(key)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            clone_or_copy(local_file_path, blob_path)
+            self.index[key] = {"url": server_relative_url, "size": size, "last_used": time.time()}
+            self._evict()
+
+    def add_later(self, key, local_file_path, server_relative_url, on_error=None):
+        """
+        Runs add() on the cache's own thread, so copying a large file into the cache
+        doesn't hold up the caller. on_error(exception) is called if it fails.
+        """
+        def add():
+            try:
+                self.add(key, local_file_path, server_relative_url)
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+        self._adder.submit(add)
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._blob_path(key))
+            except FileNotFoundError:
+                pass
+            del self.index[key]
+            total -= entry["size"]
+
+    def save(self):
+        with self.lock:
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f)
+            os.replace(temp_path, self.index_path)
+
+    def close(self, cancel_pending=False):
+        """Waits for queued adds to finish (or drops the ones not started), then saves the index."""
+        self._adder.shutdown(wait=True, cancel_futures=cancel_pending)
+        self.save()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0
+        return f"Cache: {self.hits} of {lookups} files served from cache ({hit_rate:.0f}% hit rate, {format_bytes(self.bytes_from_cache)} not re-downloaded)."
+
+def open_cache_from_config(config, queue=None):
+    """
+    Returns a ContentCache if CACHE_FOLDER_PATH is configured, otherwise None. An
+    invalid CACHE_MAX_GB is reported to queue as file_info and the default used.
+    """
+    cache_dir = config.get("CACHE_FOLDER_PATH", "").strip()
+    if not cache_dir:
+        return None
+    try:
+        max_gb = float(config.get("CACHE_MAX_GB", "") or DEFAULT_CACHE_MAX_GB)
+    except ValueError:
+        max_gb = DEFAULT_CACHE_MAX_GB
+        if queue is not None:
+            queue.put(("file_info", f"CACHE_MAX_GB must be a number, not '{config.get('CACHE_MAX_GB')}'. Using {DEFAULT_CACHE_MAX_GB} GB."))
+    return ContentCache(cache_dir, int(max_gb * 1024 ** 3))
@@ -0,0 +1,78 @@
+import threading
+from contextlib import contextmanager, nullcontext
+
+# How often the watcher checks the stop event; Stop takes effect within about this long.
+CANCEL_POLL_SECONDS = 0.2
+
+class TransferCancelled(Exception):
+    """Raised inside a transfer when the user presses Stop."""
+
+class CancelToken:
+    """
+    Lets transfers notice the GUI's stop event between chunks rather than between
+    files. Connections registered with closing() are closed from a watcher thread
+    the moment Stop is pressed, so a worker blocked on a slow read or write wakes up
+    straight away instead of waiting for the next chunk.
+    """
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+        self.lock = threading.Lock()
+        self.open_resources = {}
+        self.fired = False
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self._watch, name="CancelWatcher", daemon=True)
+        self.thread.start()
+
+    def is_set(self):
+        return self.stop_event.is_set()
+
+    def check(self):
+        if self.stop_event.is_set():
+            raise TransferCancelled("Stopped by user.")
+
+    @contextmanager
+    def closing(self, resource):
+        """
+        Closes resource if Stop is pressed while the block runs. Any error the block
+        raises after Stop (typically from the closed connection) becomes TransferCancelled.
+        """
+        token = object()
+        with self.lock:
+            fired = self.fired
+            if not fired:
+                self.open_resources[token] = resource
+        if fired:
+            resource.close()
+            raise TransferCancelled("Stopped by user.")
+        try:
+            yield resource
+        except TransferCancelled:
+            raise
+        except Exception as e:
+            if self.is_set():
+                raise TransferCancelled("Stopped by user.") from e
+            raise
+        finally:
+            with self.lock:
+                self.open_resources.pop(token, None)
+
+    def finish(self):
+        """Stops the watcher thread at the end of a job."""
+        self.finished.set()
+
+    def _watch(self):
+        while not self.finished.is_set():
+            if self.stop_event.wait(CANCEL_POLL_SECONDS):
+                with self.lock:
+                    self.fired = True
+                    resources, self.open_resources = list(self.open_resources.values()), {}
+                for resource in resources:
+                    try:
+                        resource.close()
+                    except Exception:
+                        pass
+                return
+
+def closing_on_cancel(cancel, resource):
+    """cancel.closing(resource), or a no-op when the caller has no CancelToken."""
+    return cancel.closing(resource) if cancel is not None else nullcontext(resource)
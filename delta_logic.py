@@ -0,0 +1,147 @@
+import os
+import json
+from datetime import datetime
+
+DELTA_STATE_FILENAME = "delta_state.json"
+# SharePoint change types (SP.ChangeType) that mean an item is gone from its old location.
+_REMOVED_CHANGE_TYPES = {3, 5}  # DeleteObject, MoveAway
+_FETCH_LIMIT = 1000
+
+def _token_string(token):
+    if token is None:
+        return None
+    if isinstance(token, dict):
+        return token.get("StringValue")
+    return getattr(token, "StringValue", None) or str(token) or None
+
+class SharePointChangeSource:
+    """Reads the document library's change log through the office365 client."""
+    def __init__(self, ctx, library_url):
+        self.ctx = ctx
+        self.library = ctx.web.get_list(library_url)
+
+    def current_token(self):
+        self.ctx.load(self.library, ["CurrentChangeToken"])
+        self.ctx.execute_query()
+        return _token_string(self.library.properties.get("CurrentChangeToken"))
+
+    def changes_since(self, token):
+        """
+        Returns (changes, latest token), where changes is a list of
+        ("changed" | "removed", server-relative URL or None) in log order.
+        """
+        from office365.sharepoint.changes.query import ChangeQuery
+        from office365.sharepoint.changes.token import ChangeToken
+        changes = []
+        while True:
+            query = ChangeQuery(Item=True, Add=True, Update=True, DeleteObject=True, Rename=True, Move=True, Restore=True,
+                                ChangeTokenStart=ChangeToken(token), FetchLimit=str(_FETCH_LIMIT))
+            batch = self.library.get_changes(query)
+            self.ctx.load(batch)
+            self.ctx.execute_query()
+            for change in batch:
+                change_type = int(getattr(change.change_type, "value", change.change_type) or 0)
+                kind = "removed" if change_type in _REMOVED_CHANGE_TYPES else "changed"
+                changes.append((kind, change.properties.get("ServerRelativeUrl")))
+                token = _token_string(change.properties.get("ChangeToken")) or token
+            if len(batch) < _FETCH_LIMIT:
+                return changes, token
+
+class LocalChangeSource:
+    """
+    A stand-in change feed read from a JSON file, so delta mode can be exercised
+    without SharePoint. The file looks like:
+        {"current_token": "3", "oldest_token": "1",
+         "changes": [{"token": "2", "type": "changed", "url": "/sites/x/Shared Documents/D1/a.pdf"}, ...]}
+    Tokens are sequence numbers; changes_since returns entries with a higher token.
+    The optional oldest_token is where the log starts: an older token raises, as an
+    expired token does on SharePoint.
+    """
+    def __init__(self, feed_path):
+        with open(feed_path, 'r', encoding='utf-8') as f:
+            self.feed = json.load(f)
+
+    def current_token(self):
+        return str(self.feed["current_token"])
+
+    def changes_since(self, token):
+        oldest_token = self.feed.get("oldest_token")
+        if oldest_token is not None and int(token) < int(oldest_token):
+            raise ValueError(f"The change token {token} has expired; the change log starts at {oldest_token}.")
+        newer = [c for c in self.feed.get("changes", []) if int(c["token"]) > int(token)]
+        latest = max([int(token)] + [int(c["token"]) for c in newer])
+        return [(c["type"], c.get("url")) for c in newer], str(latest)
+
+class DeltaPlan:
+    """
+    Which files under a synced folder have changed or been removed since the stored
+    token. Lookups are case-insensitive, as SharePoint URLs are.
+    """
+    def __init__(self, changes, folder_url):
+        prefix = folder_url.rstrip('/').lower() + '/'
+        self.changed = set()
+        self.removed = set()
+        for kind, url in changes:
+            key = url.lower()
+            if not key.startswith(prefix):
+                continue
+            if kind == "removed":
+                self.removed.add(key)
+                self.changed.discard(key)
+            else:
+                self.changed.add(key)
+                self.removed.discard(key)
+
+    def is_changed(self, server_relative_url):
+        return server_relative_url.lower() in self.changed
+
+    def is_removed(self, server_relative_url):
+        return server_relative_url.lower() in self.removed
+
+class DeltaState:
+    """Stores the last change token per synced SharePoint folder and local folder pair."""
+    def __init__(self, state_path):
+        self.state_path = state_path
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.state = {}
+
+    @staticmethod
+    def _key(folder_url, local_dir):
+        return f"{folder_url.lower()}|{os.path.normcase(os.path.abspath(local_dir))}"
+
+    def get_token(self, folder_url, local_dir):
+        entry = self.state.get(self._key(folder_url, local_dir))
+        return entry["token"] if entry else None
+
+    def set_token(self, folder_url, local_dir, token):
+        self.state[self._key(folder_url, local_dir)] = {"token": token, "synced_at": datetime.now().isoformat()}
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.state_path)
+
+def plan_delta(source, token, folder_url):
+    """
+    Returns (DeltaPlan, None) for changes under folder_url since token, or
+    (None, reason) when a full sync is needed instead: no previous token, the change
+    log no longer reaches back that far, or a change could not be tied to a path.
+    """
+    if not token:
+        return None, "no previous sync of this folder was recorded"
+    try:
+        changes, _ = source.changes_since(token)
+    except Exception as e:
+        return None, f"the change log could not be read from the stored token ({e})"
+    if any(url is None for _, url in changes):
+        return None, "some changes did not include a file path"
+    return DeltaPlan(changes, folder_url), None
+
+def open_change_source(ctx, library_url, config):
+    """The SharePoint change log, or a local stand-in feed if DELTA_CHANGE_FEED_PATH is configured."""
+    feed_path = config.get("DELTA_CHANGE_FEED_PATH", "").strip()
+    if feed_path:
+        return LocalChangeSource(feed_path)
+    return SharePointChangeSource(ctx, library_url)
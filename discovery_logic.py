@@ -1,9 +1,16 @@
 import os
 import re
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from office365.runtime.auth.user_credential import UserCredential
 from office365.sharepoint.client_context import ClientContext
 
+from index_logic import FolderIndex
+
+# Maximum number of folder listing requests in flight during a library crawl.
+CRAWL_WORKERS = 6
+
 def discover_data_folders(sharepoint_url, queue, config_path):
     """
     Connects to SharePoint, lists TOP-LEVEL folders in 'Shared Documents',
@@ -68,4 +75,93 @@ def discover_sub_folders(sharepoint_url, parent_folder_url, queue, config_path):
         queue.put(("sub_folders_found", all_sub_folders))
 
     except Exception as e:
-        queue.put(("error", str(e)))
\ No newline at end of file
+        queue.put(("error", str(e)))
+
+def list_folder_files(ctx, folder_url):
+    """
+    Lists every file under a SharePoint folder and its sub-folders, one listing per
+    folder rather than a request per file. Returns {lower-cased server-relative URL:
+    (size, version)}, where version is the ETag (or modified time if there is none).
+    """
+    files = {}
+    pending_folders = [folder_url]
+    while pending_folders:
+        folder = ctx.web.get_folder_by_server_relative_url(pending_folders.pop())
+        folder_files = folder.files
+        sub_folders = folder.folders
+        ctx.load(folder_files, ["ServerRelativeUrl", "Length", "ETag", "TimeLastModified"])
+        ctx.load(sub_folders, ["Name", "ServerRelativeUrl"])
+        ctx.execute_query()
+        for f in folder_files:
+            files[f.properties["ServerRelativeUrl"].lower()] = (int(f.properties.get("Length") or 0), f.properties.get("ETag") or f.properties.get("TimeLastModified"))
+        pending_folders.extend(f.properties["ServerRelativeUrl"] for f in sub_folders if f.properties["Name"].lower() != "forms")
+    return files
+
+def crawl_library(sharepoint_url, index_path, queue, config_path, stop_event):
+    """
+    Enumerates every folder in 'Shared Documents' breadth-first, with up to
+    CRAWL_WORKERS listing requests running at once, and stores the results in the
+    local folder index. A folder whose modified time and item count have not changed
+    since the last crawl is not listed again, but its known sub-folders are: a change
+    further down does not show on it, only on the folder that changed. So every folder
+    is either listed or compared against its parent's listing.
+    Reports ("crawl_progress", folders_indexed) as it goes and ("crawl_done", folders_indexed) at the end.
+    """
+    index = None
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        user_credentials = UserCredential(config["APP_USERNAME"], config["APP_PASSWORD"])
+        # Client contexts queue queries internally, so each worker thread needs its own.
+        thread_state = threading.local()
+        def get_context():
+            if not hasattr(thread_state, "ctx"):
+                thread_state.ctx = ClientContext(sharepoint_url).with_credentials(user_credentials)
+            return thread_state.ctx
+
+        def list_sub_folders(folder_url):
+            ctx = get_context()
+            sub_folders = ctx.web.get_folder_by_server_relative_url(folder_url).folders
+            ctx.load(sub_folders, ["Name", "ServerRelativeUrl", "ItemCount", "TimeLastModified"])
+            ctx.execute_query()
+            return [(f.properties["Name"], f.properties["ServerRelativeUrl"], f.properties.get("ItemCount"), str(f.properties.get("TimeLastModified")))
+                    for f in sub_folders]
+
+        ctx = get_context()
+        web = ctx.web
+        ctx.load(web, ["ServerRelativeUrl"])
+        ctx.execute_query()
+        library_url = f"{web.properties['ServerRelativeUrl'].rstrip('/')}/Shared Documents"
+
+        index = FolderIndex(index_path)
+        frontier = [library_url]
+        with ThreadPoolExecutor(max_workers=CRAWL_WORKERS) as executor:
+            while frontier and not stop_event.is_set():
+                futures = {executor.submit(list_sub_folders, url): url for url in frontier}
+                frontier = []
+                for future in as_completed(futures):
+                    if stop_event.is_set():
+                        # Don't start the rest of this level; listings already running are discarded.
+                        for queued in futures:
+                            queued.cancel()
+                        break
+                    folder_url = futures[future]
+                    try:
+                        children = future.result()
+                    except Exception as e:
+                        queue.put(("crawl_error", f"Could not list '{folder_url}': {e}"))
+                        continue
+                    if folder_url == library_url:
+                        children = [child for child in children if child[0].lower() != "forms"]
+                    needs_listing, unchanged = index.update_children(folder_url, library_url, children)
+                    frontier.extend(needs_listing)
+                    for unchanged_url in unchanged:
+                        frontier.extend(index.known_children(unchanged_url))
+                    index.mark_listed(folder_url)
+                    queue.put(("crawl_progress", index.folder_count()))
+        queue.put(("crawl_done", index.folder_count()))
+    except Exception as e:
+        queue.put(("crawl_error", str(e)))
+    finally:
+        if index:
+            index.close()
@@ -2,58 +2,461 @@ import os
 import re
 from io import BytesIO
 import json
+import threading
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from urllib.parse import quote, unquote
 
 from office365.runtime.auth.user_credential import UserCredential
+from office365.runtime.http.request_options import RequestOptions
 from office365.sharepoint.client_context import ClientContext
 from office365.sharepoint.files.file import File as SPFile
 
-def perform_download(sharepoint_url, sharepoint_folder_relative_path, manifest_filename, local_folder_id, data_folder_path, queue, stop_event, config_path, output_dir):
+import resume_logic
+from cache_logic import clone_or_copy, open_cache_from_config
+from write_logic import LocalWriter
+from throttle_logic import bandwidth_limiter
+from delta_logic import DELTA_STATE_FILENAME, DeltaState, open_change_source, plan_delta
+from trace_logic import tracer
+from cancel_logic import CancelToken, TransferCancelled, closing_on_cancel
+from discovery_logic import list_folder_files
+from plan_logic import ByteProgress, MakespanMeter, ManifestRow, format_bytes, format_count, int_from_config, order_by_size, transfer_order_from_config
+from preflight_logic import THROUGHPUT_HISTORY_FILENAME, Preflight, ThroughputHistory, group_by_source
+
+# Files larger than this are fetched as several concurrent byte-range requests.
+RANGE_DOWNLOAD_THRESHOLD = 128 * 1024 * 1024
+RANGE_PART_SIZE = 32 * 1024 * 1024
+RANGE_WORKERS = 4
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def _file_value_url(ctx, server_relative_url):
+    """
+    Builds the same '$value' endpoint URL that SPFile.open_binary requests.
+    """
+    # service_root_url is a method on older client versions and a property on newer ones
+    service_root_url = ctx.service_root_url() if callable(ctx.service_root_url) else ctx.service_root_url
+    decoded_url = unquote(server_relative_url).replace("'", "''")
+    return f"{service_root_url}/web/getFileByServerRelativePath(DecodedUrl='{quote(decoded_url)}')/$value"
+
+def _open_file_stream(ctx, server_relative_url, start=None, end=None):
+    """
+    Opens a streaming GET for a SharePoint file, optionally limited to a byte range.
+    Raises an HTTPError for an error status, as the SPFile.open_binary plus
+    raise_for_status() it replaces did, so 404 handling is unchanged.
+    """
+    request = RequestOptions(_file_value_url(ctx, server_relative_url))
+    request.stream = True
+    if start is not None:
+        request.set_header("Range", f"bytes={start}-{'' if end is None else end}")
+    response = ctx.pending_request().execute_request_direct(request)
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return response
+
+def _parse_content_range_total(content_range):
+    """Returns the total size from a 'bytes 0-99/1234' Content-Range header."""
+    match = re.match(r'bytes\s+\d+-\d+/(\d+)', content_range or "")
+    if not match:
+        raise IOError(f"Unexpected Content-Range header: '{content_range}'")
+    return int(match.group(1))
+
+def _stream_to_writer(response, writer, part_file_path, offset, cancel=None, progress=None):
+    """Hands a response body to the local writer in chunks, starting at the given offset."""
+    written = 0
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        if cancel is not None:
+            cancel.check()
+        if chunk:
+            bandwidth_limiter.consume("download", len(chunk), cancel.stop_event if cancel is not None else None)
+            writer.write(part_file_path, offset + written, chunk, cancel)
+            written += len(chunk)
+            if progress is not None:
+                progress.add(len(chunk))
+    return written
+
+def _response_version(response):
+    """The ETag (or Last-Modified if no ETag is sent) used to detect a stale partial file."""
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+def _plan_ranges(total_size):
+    """
+    Splits a file into the byte ranges it is downloaded as. The split only depends
+    on the size, so a sidecar can record finished ranges by their start offset.
+    """
+    if total_size <= RANGE_PART_SIZE:
+        return [(0, total_size - 1)]
+    if total_size <= RANGE_DOWNLOAD_THRESHOLD:
+        return [(0, RANGE_PART_SIZE - 1), (RANGE_PART_SIZE, total_size - 1)]
+    return [(start, min(start + RANGE_PART_SIZE, total_size) - 1) for start in range(0, total_size, RANGE_PART_SIZE)]
+
+class ClientContextPool:
+    """
+    Signed-in client contexts for range threads, reused across files. Client contexts
+    queue queries internally, so each thread acquires its own and releases it when
+    its range is done.
+    """
+    def __init__(self, make_context):
+        self.make_context = make_context
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.make_context()
+
+    def release(self, ctx):
+        with self.lock:
+            self.idle.append(ctx)
+
+class _SourceChangedError(IOError):
+    pass
+
+class _RangeNotHonouredError(IOError):
+    pass
+
+def _download_range(ctx, server_relative_url, writer, part_file_path, start, end, version, cancel=None, progress=None):
+    with tracer.span("range", "network", url=server_relative_url, start=start, end=end):
+        if cancel is not None:
+            cancel.check()
+        response = _open_file_stream(ctx, server_relative_url, start, end)
+        try:
+            with closing_on_cancel(cancel, response):
+                if response.status_code == 200:
+                    raise _RangeNotHonouredError(f"Server did not honour range {start}-{end} (HTTP {response.status_code}).")
+                if response.status_code != 206:
+                    raise IOError(f"Unexpected reply to range {start}-{end} (HTTP {response.status_code}).")
+                current_version = _response_version(response)
+                if version and current_version and current_version != version:
+                    raise _SourceChangedError(f"'{server_relative_url}' changed on SharePoint since the partial download was started.")
+                written = _stream_to_writer(response, writer, part_file_path, start, cancel, progress)
+        finally:
+            response.close()
+    if written != end - start + 1:
+        raise IOError(f"Range {start}-{end} returned {written} bytes, expected {end - start + 1}.")
+
+def _complete_download(local_file_path, total_size, on_complete):
+    """Runs on the writer thread once every byte of the '.dth-part' file has been written."""
+    resume_logic.finalize_partial(local_file_path)
+    if on_complete:
+        on_complete(local_file_path)
+    return total_size
+
+def _download_to_part(ctx, server_relative_url, local_file_path, writer, state, cancel=None, progress=None, contexts=None):
+    """
+    Fetches whatever is still missing of the file into '<name>.dth-part'. Returns the total size.
+    Range threads take their own client context from contexts, or share ctx without one.
+    """
+    part_file_path = resume_logic.part_path(local_file_path)
+    if state is None:
+        with tracer.span("opening range", "network", url=server_relative_url):
+            try:
+                response = _open_file_stream(ctx, server_relative_url, 0, RANGE_PART_SIZE - 1)
+            except Exception as e:
+                # Zero-byte files cannot satisfy a range request.
+                if getattr(getattr(e, "response", None), "status_code", None) != 416:
+                    raise
+                response = _open_file_stream(ctx, server_relative_url)
+            try:
+                with closing_on_cancel(cancel, response):
+                    if response.status_code == 200:
+                        # Range not honoured: the response is the whole file in a single stream.
+                        expected = response.headers.get("Content-Length")
+                        writer.submit(resume_logic.discard_sidecar, local_file_path)
+                        writer.open(part_file_path, int(expected) if expected else None)
+                        written = _stream_to_writer(response, writer, part_file_path, 0, cancel, progress)
+                        if expected is not None and written != int(expected):
+                            raise IOError(f"Received {written} bytes, expected {expected}.")
+                        return written
+                    if response.status_code != 206:
+                        raise IOError(f"Unexpected reply to a range request (HTTP {response.status_code}).")
+
+                    total_size = _parse_content_range_total(response.headers.get("Content-Range"))
+                    state = {"size": total_size, "version": _response_version(response), "completed": []}
+                    writer.open(part_file_path, total_size)
+                    writer.submit(resume_logic.write_sidecar, local_file_path, dict(state, completed=[]), file_path=part_file_path)
+                    first_part_size = _stream_to_writer(response, writer, part_file_path, 0, cancel, progress)
+            finally:
+                response.close()
+
+            if first_part_size != min(RANGE_PART_SIZE, total_size):
+                raise IOError(f"Opening range returned {first_part_size} bytes, expected {min(RANGE_PART_SIZE, total_size)}.")
+            state["completed"].append(0)
+            writer.submit(resume_logic.write_sidecar, local_file_path, dict(state, completed=[0]), file_path=part_file_path)
+    else:
+        writer.open(part_file_path, resume=True)
+
+    total_size = state["size"]
+    pending_ranges = [(start, end) for start, end in _plan_ranges(total_size) if start not in state["completed"]]
+    if pending_ranges:
+        state_lock = threading.Lock()
+
+        def fetch_range(start, end):
+            range_ctx = contexts.acquire() if contexts else ctx
+            try:
+                _download_range(range_ctx, server_relative_url, writer, part_file_path, start, end, state["version"], cancel, progress)
+            finally:
+                if contexts:
+                    contexts.release(range_ctx)
+            with state_lock:
+                state["completed"].append(start)
+                # Recorded only after the range's data has been flushed to the part file.
+                writer.submit(resume_logic.write_sidecar, local_file_path, dict(state, completed=list(state["completed"])), file_path=part_file_path)
+
+        with ThreadPoolExecutor(max_workers=min(RANGE_WORKERS, len(pending_ranges))) as executor:
+            futures = [executor.submit(tracer.profiled, fetch_range, start, end) for start, end in pending_ranges]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                # Don't start ranges that are still queued; finished ones stay recorded for resume.
+                for future in futures:
+                    future.cancel()
+                raise
+    missing_ranges = [start for start, _ in _plan_ranges(total_size) if start not in state["completed"]]
+    if missing_ranges:
+        raise IOError(f"Ranges starting at {missing_ranges} were never downloaded.")
+    return total_size
+
+def download_sharepoint_file(ctx, server_relative_url, local_file_path, writer, on_complete=None, cancel=None, progress=None, contexts=None):
+    """
+    Downloads a single SharePoint file, handing the data to the local writer.
+    Data is written to '<name>.dth-part' and only renamed into place once complete.
+    The first request asks for the opening byte range: small files complete with
+    that one request, large files are preallocated and the remaining ranges fetched
+    concurrently. If the server ignores the Range header the full body is streamed.
+    An interrupted download resumes from the ranges its sidecar records as done,
+    unless the file has changed on SharePoint since or the server no longer honours
+    range requests, in which case it starts again from the beginning. With a CancelToken, Stop aborts
+    the open requests within a chunk and raises TransferCancelled, keeping the partial.
+    progress, if given, has add(num_bytes) called as data arrives. contexts, a
+    ClientContextPool, gives each concurrent range request its own client context.
+
+    Network errors are raised directly. Returns a Future that resolves to the file
+    size once it is on disk (after on_complete has run), or to the disk error.
+    """
+    part_file_path = resume_logic.part_path(local_file_path)
+    state = resume_logic.read_sidecar(local_file_path)
+    try:
+        try:
+            total_size = _download_to_part(ctx, server_relative_url, local_file_path, writer, state, cancel, progress, contexts)
+        except (_SourceChangedError, _RangeNotHonouredError):
+            if state is None:
+                raise
+            writer.abort(part_file_path)
+            writer.submit(resume_logic.discard_partial, local_file_path)
+            total_size = _download_to_part(ctx, server_relative_url, local_file_path, writer, None, cancel, progress, contexts)
+    except Exception:
+        # Keep what has arrived so far for the next attempt to resume from.
+        writer.abort(part_file_path)
+        raise
+    return writer.submit(_complete_download, local_file_path, total_size, on_complete, file_path=part_file_path, close=True)
+
+def get_file_version(ctx, server_relative_url):
+    """
+    Returns (size, version) for a SharePoint file from its metadata, where version is
+    the ETag (or modified time if no ETag is available).
+    """
+    with tracer.span("file metadata", "network", url=server_relative_url):
+        sp_file = ctx.web.get_file_by_server_relative_url(server_relative_url)
+        ctx.load(sp_file, ["ETag", "Length", "TimeLastModified"])
+        ctx.execute_query()
+    version = sp_file.properties.get("ETag") or sp_file.properties.get("TimeLastModified")
+    return int(sp_file.properties.get("Length") or 0), version
+
+def _add_to_cache(cache, cache_key, local_file_path, server_relative_url, queue):
+    """
+    Queues a finished download to be copied into the cache on the cache's own thread,
+    not the writer's. A cache failure (e.g. a full cache disk) is reported but doesn't fail the file.
+    """
+    def report(e):
+        if queue is not None:
+            queue.put(("file_info", f"Could not add '{os.path.basename(local_file_path)}' to the download cache: {type(e).__name__} - {e}"))
+    cache.add_later(cache_key, local_file_path, server_relative_url, on_error=report)
+
+def fetch_file(ctx, server_relative_url, local_file_path, writer, cache=None, cancel=None, progress=None, queue=None, version=None, contexts=None):
+    """
+    Materialises a SharePoint file at local_file_path, from the content cache when
+    it holds the current version, otherwise over the network (adding it to the cache,
+    with any cache error reported to queue as file_info). version, if the caller
+    already knows it from a folder listing, saves the metadata request. contexts is
+    passed on to download_sharepoint_file.
+    Returns a Future as download_sharepoint_file does.
+    """
+    if cache is None:
+        return download_sharepoint_file(ctx, server_relative_url, local_file_path, writer, cancel=cancel, progress=progress, contexts=contexts)
+    if version is None:
+        _, version = get_file_version(ctx, server_relative_url)
+    cache_key = cache.make_key(server_relative_url, version)
+    if cache.lookup(cache_key) is not None:
+        return writer.submit(cache.materialise, cache_key, local_file_path, file_path=local_file_path)
+    return download_sharepoint_file(ctx, server_relative_url, local_file_path, writer,
+                                    on_complete=lambda path: _add_to_cache(cache, cache_key, path, server_relative_url, queue), cancel=cancel, progress=progress, contexts=contexts)
+
+def _copy_fetched_file(source_write, source_path, local_file_path):
+    """
+    Runs on the writer thread after source_write, the write of a file another manifest
+    row fetched: copies it to this row's path (by reflink where the filesystem supports
+    it), never hardlinking, so editing one copy leaves the others alone. Returns the size.
+    """
+    # Already finished, as writer calls run in the order they were submitted; a failed fetch fails this row too.
+    size = source_write.result(timeout=0)
+    clone_or_copy(source_path, local_file_path)
+    return size
+
+def _collect_finished_writes(pending_writes, queue, error_log_file, wait=False):
+    """
+    Reports manifest files whose local write failed and drops finished entries from
+    pending_writes. With wait=True it blocks until every pending write has finished.
+    Returns the number of failures found.
+    """
+    failures = 0
+    still_pending = []
+    for future, relative_file_path in pending_writes:
+        if not wait and not future.done():
+            still_pending.append((future, relative_file_path))
+            continue
+        try:
+            future.result()
+        except Exception as e:
+            error_message = f"Failed to write '{relative_file_path}' to disk. Reason: {type(e).__name__} - {e}"
+            queue.put(("file_error", error_message))
+            with open(error_log_file, "a", encoding='utf-8') as f: f.write(f"{datetime.now().isoformat()} - {error_message}\n")
+            failures += 1
+    pending_writes[:] = still_pending
+    return failures
+
+def run_jobs(jobs, function, workers, stop_event):
+    """
+    Runs function(job) for each job, up to workers at a time, yielding (job, Future)
+    as each finishes. No new job is started once stop_event is set. With a single
+    worker the jobs run one after another on the calling thread.
+    """
+    if workers == 1:
+        for job in jobs:
+            if stop_event.is_set():
+                return
+            result = Future()
+            try:
+                result.set_result(function(job))
+            except Exception as e:
+                result.set_exception(e)
+            yield job, result
+        return
+    jobs = iter(jobs)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < workers and not stop_event.is_set():
+                job = next(jobs, None)
+                if job is None:
+                    break
+                in_flight[executor.submit(function, job)] = job
+            if not in_flight:
+                return
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield in_flight.pop(future), future
+
+def perform_download(sharepoint_url, sharepoint_folder_relative_path, manifest_filename, local_folder_id, data_folder_path, queue, stop_event, config_path, output_dir, delta_sync=False, dry_run=False):
     """
     Performs the download process for a specific SharePoint folder using a specified manifest file.
+    With delta_sync, files already on disk are only fetched again if the library's change
+    log shows them changed since the last clean run into the same local folder.
+    With dry_run, nothing is downloaded or written: the manifest rows are resolved against
+    a listing of the folder and a preflight report is sent as ("preflight_done", lines).
     """
     error_log_file = None
     error_count = 0
     local_base_dir = None 
+    cache = None
+    writer = None
+    pending_writes = []
+    tracing = False
+    cancel = CancelToken(stop_event)
     try:
-        # Use the provided output_dir for the error log
-        error_log_file = os.path.join(output_dir, "download_errors.txt")
+        if not dry_run:
+            # Use the provided output_dir for the error log
+            error_log_file = os.path.join(output_dir, "download_errors.txt")
 
-        if os.path.exists(error_log_file):
-            os.remove(error_log_file)
+            if os.path.exists(error_log_file):
+                os.remove(error_log_file)
 
         queue.put(("status", "Loading credentials..."))
         with open(config_path, 'r') as f:
             config = json.load(f)
         APP_USERNAME = config["APP_USERNAME"]
         APP_PASSWORD = config["APP_PASSWORD"]
+        tracing = tracer.start_from_config(config)
+        bandwidth_limiter.configure_from_config(config, queue)
+        download_workers = int_from_config(config, "DOWNLOAD_WORKERS", 1, queue, minimum=1)
+        transfer_order = transfer_order_from_config(config, queue)
+        cache = open_cache_from_config(config, queue) if not dry_run else None
+        if cache:
+            queue.put(("file_info", f"Using download cache at '{cache.cache_dir}'."))
 
         queue.put(("status", "Re-connecting to SharePoint..."))
-        user_credentials = UserCredential(APP_USERNAME, APP_PASSWORD)
-        ctx = ClientContext(sharepoint_url).with_credentials(user_credentials)
-        web = ctx.web
-        ctx.load(web, ["ServerRelativeUrl"])
-        ctx.execute_query()
+        with tracer.span("authenticate"):
+            user_credentials = UserCredential(APP_USERNAME, APP_PASSWORD)
+            ctx = ClientContext(sharepoint_url).with_credentials(user_credentials)
+            web = ctx.web
+            ctx.load(web, ["ServerRelativeUrl"])
+            ctx.execute_query()
 
         site_relative_url = web.properties['ServerRelativeUrl']
         data_folder_url = f"{site_relative_url.rstrip('/')}/Shared Documents/{sharepoint_folder_relative_path}"
 
         queue.put(("status", f"Downloading '{manifest_filename}' from SharePoint folder '{sharepoint_folder_relative_path}'..."))
         index_file_url = f"{data_folder_url}/{manifest_filename}"
-        response = SPFile.open_binary(ctx, index_file_url)
-        response.raise_for_status()
+        with tracer.span("download manifest", url=index_file_url):
+            response = SPFile.open_binary(ctx, index_file_url)
+            response.raise_for_status()
 
         local_base_dir = os.path.join(data_folder_path, local_folder_id)
-        if not os.path.exists(local_base_dir):
+        if not dry_run and not os.path.exists(local_base_dir):
             os.makedirs(local_base_dir)
 
-        local_index_path = os.path.join(local_base_dir, manifest_filename)
-        with open(local_index_path, "wb") as f:
-            f.write(response.content)
-        queue.put(("file_info", f"Saved a local copy of '{manifest_filename}' to '{local_base_dir}'."))
+        delta_state = DeltaState(os.path.join(output_dir, DELTA_STATE_FILENAME))
+        change_source = None
+        new_change_token = None
+        try:
+            with tracer.span("read change token"):
+                change_source = open_change_source(ctx, f"{site_relative_url.rstrip('/')}/Shared Documents", config)
+                if not dry_run:
+                    # Read on every download, not only delta syncs: a clean full download then
+                    # gives the first delta sync into this folder a starting point. Taken before
+                    # any file is read, so changes made during this run are picked up next time.
+                    new_change_token = change_source.current_token()
+        except Exception as e:
+            queue.put(("file_info", f"Could not read the library's change token; the next delta sync will check every file. ({type(e).__name__} - {e})"))
+        delta_plan = None
+        if delta_sync:
+            if change_source is None or not (new_change_token or dry_run):
+                delta_plan, reason = None, "the change log is unavailable"
+            else:
+                with tracer.span("plan delta"):
+                    delta_plan, reason = plan_delta(change_source, delta_state.get_token(data_folder_url, local_base_dir), data_folder_url)
+            if delta_plan is None:
+                queue.put(("file_info", f"Delta sync not possible ({reason}). Checking every file instead."))
+            else:
+                queue.put(("file_info", f"Delta sync: {len(delta_plan.changed)} changed and {len(delta_plan.removed)} removed files under '{sharepoint_folder_relative_path}' since the last run."))
+        unchanged_count = 0
+        removed_count = 0
+
+        if not dry_run:
+            local_index_path = os.path.join(local_base_dir, manifest_filename)
+            with open(local_index_path, "wb") as f:
+                f.write(response.content)
+            queue.put(("file_info", f"Saved a local copy of '{manifest_filename}' to '{local_base_dir}'."))
+            writer = LocalWriter(fsync_batch_size=int_from_config(config, "DOWNLOAD_FSYNC_BATCH", 0, queue))
 
-        df = pd.read_csv(BytesIO(response.content), encoding='utf-8-sig')
+        with tracer.span("parse manifest"):
+            df = pd.read_csv(BytesIO(response.content), encoding='utf-8-sig')
 
         file_column_name = None
         if 'File' in df.columns:
@@ -71,54 +474,187 @@ def perform_download(sharepoint_url, sharepoint_folder_relative_path, manifest_f
         total_files = len(df)
         queue.put(("status", f"Found {total_files} files to download listed in '{manifest_filename}'."))
 
+        rows = []
         for index, row in df.iterrows():
-            if stop_event.is_set():
-                queue.put(("status", "Download stopped by user."))
-                queue.put(("stopped", (local_base_dir, error_count)))
-                return
-
-            queue.put(("progress", (index + 1, total_files)))
             relative_file_path = row[file_column_name]
             if not isinstance(relative_file_path, str) or not relative_file_path.strip():
                 queue.put(("file_info", f"Skipping empty or invalid file path in row {index + 2} of {manifest_filename} (column '{file_column_name}')."))
                 continue
             file_basename = os.path.basename(relative_file_path)
-            queue.put(("filename", f"Processing: {file_basename}"))
-
-            download_successful = False
             local_file_path = os.path.join(local_base_dir, relative_file_path.lstrip('\\/'))
-            local_dir = os.path.dirname(local_file_path)
-            if not os.path.exists(local_dir): os.makedirs(local_dir)
+            full_path_suffix = relative_file_path.replace('\\', '/').lstrip('/')
+            url_attempt_1 = f"{data_folder_url}/{full_path_suffix}"
+            url_attempt_2 = f"{data_folder_url}/{file_basename}"
+
+            if delta_plan is not None and os.path.isfile(local_file_path):
+                if delta_plan.is_removed(url_attempt_1) or delta_plan.is_removed(url_attempt_2):
+                    queue.put(("file_info", f"'{relative_file_path}' has been removed from SharePoint since the last run. The local copy was kept."))
+                    removed_count += 1
+                    continue
+                if not delta_plan.is_changed(url_attempt_1) and not delta_plan.is_changed(url_attempt_2):
+                    unchanged_count += 1
+                    continue
+            rows.append(ManifestRow(relative_file_path, local_file_path, url_attempt_1, url_attempt_2))
+
+        preflight = None
+        if rows:
+            queue.put(("status", "Listing the folder to size the download..."))
+            try:
+                # One listing per folder instead of a request per manifest row.
+                with tracer.span("list folder files", "network", url=data_folder_url):
+                    preflight = Preflight(rows, list_folder_files(ctx, data_folder_url))
+            except Exception as e:
+                if dry_run:
+                    raise
+                queue.put(("file_info", f"Could not list the folder's files; progress is shown by file count and files are downloaded in manifest order. ({type(e).__name__} - {e})"))
+        history = ThroughputHistory(os.path.join(output_dir, THROUGHPUT_HISTORY_FILENAME))
+        if dry_run:
+            if preflight:
+                report = preflight.report(history, download_workers, transfer_order)
+            elif delta_plan is not None:
+                report = ["No files need downloading: every manifest row was skipped by delta sync."]
+            else:
+                report = ["The manifest lists no files to download."]
+            if delta_plan is not None:
+                report.append(f"Delta sync: {format_count(unchanged_count, 'unchanged file')} would be skipped, "
+                              f"{format_count(removed_count, 'file')} removed from SharePoint would be kept locally.")
+            for line in report:
+                queue.put(("file_info", line))
+            queue.put(("status", f"Preflight of '{sharepoint_folder_relative_path}' finished. Nothing was downloaded."))
+            queue.put(("preflight_done", report))
+            return
+
+        size_of = preflight.size_of if preflight else (lambda manifest_row: None)
+        # Each server file is fetched once; rows sharing it get a link or copy afterwards.
+        groups = group_by_source(rows, preflight)
+        shared_row_count = sum(len(others) for _, others in groups)
+        if shared_row_count:
+            queue.put(("file_info", f"{format_count(shared_row_count, 'manifest row')} {'fetches' if shared_row_count == 1 else 'fetch'} the same file as an earlier row. Each file will be downloaded once and copied to the other paths."))
+        group_size = lambda group: size_of(group[0])
+        scheduled_groups = order_by_size(groups, group_size, transfer_order) if preflight else groups
+        meter = MakespanMeter(transfer_order if preflight else "as_listed", download_workers,
+                              [group_size(g) for g in groups], [group_size(g) for g in scheduled_groups])
+        byte_progress = None
+        if preflight:
+            unique_bytes = sum(group_size(g) or 0 for g in groups)
+            queue.put(("file_info", f"{format_bytes(unique_bytes)} to download."))
+            byte_progress = ByteProgress(unique_bytes, queue)
+            byte_progress.flush()
 
+        spare_contexts = [ctx]
+        thread_state = threading.local()
+        def get_context():
+            # Client contexts queue queries internally, so each worker thread needs its own.
+            # The first one to ask reuses the context that is already signed in.
+            if not hasattr(thread_state, "ctx"):
+                try:
+                    thread_state.ctx = spare_contexts.pop()
+                except IndexError:
+                    thread_state.ctx = ClientContext(sharepoint_url).with_credentials(user_credentials)
+            return thread_state.ctx
+        range_contexts = ClientContextPool(lambda: ClientContext(sharepoint_url).with_credentials(user_credentials))
+
+        def download_row(manifest_row):
+            """Fetches one manifest row, trying the folder root if its path is not found. Returns (write future or None, error messages)."""
+            relative_file_path = manifest_row.relative_file_path
+            file_basename = os.path.basename(relative_file_path)
+            queue.put(("filename", f"Processing: {file_basename}"))
+            row_ctx = get_context()
+            errors = []
+            file_progress = byte_progress.for_file(size_of(manifest_row)) if byte_progress else None
+            first_url = manifest_row.primary_url
+            resolved = preflight.resolve(manifest_row) if preflight else None
+            if resolved and resolved[0] != first_url:
+                # The listing shows the file only at the folder root, so skip the request that would 404.
+                queue.put(("file_info", f"Path '{relative_file_path}' not found for '{file_basename}' in '{sharepoint_folder_relative_path}'. Using the copy at the root of this folder."))
+                first_url = resolved[0]
             try:
-                full_path_suffix = relative_file_path.replace('\\', '/').lstrip('/')
-                url_attempt_1 = f"{data_folder_url}/{full_path_suffix}"
-                file_response = SPFile.open_binary(ctx, url_attempt_1)
-                with open(local_file_path, "wb") as f: f.write(file_response.content)
-                download_successful = True
+                with tracer.span("fetch", "file", path=relative_file_path):
+                    future = fetch_file(row_ctx, first_url, manifest_row.local_file_path, writer, cache, cancel, file_progress, queue,
+                                        resolved[2] if resolved else None, range_contexts)
+                if file_progress:
+                    file_progress.finish()
+                return future, errors
+            except TransferCancelled:
+                raise
             except Exception as e1:
+                if first_url != manifest_row.primary_url:
+                    errors.append(f"Failed to download '{relative_file_path}' from the root of '{sharepoint_folder_relative_path}'. Error: {type(e1).__name__} - {e1}")
+                    return None, errors
                 if "404" in str(e1) or "File Not Found" in str(e1) or "Cannot find" in str(e1):
                     queue.put(("file_info", f"Path '{relative_file_path}' not found for '{file_basename}' in '{sharepoint_folder_relative_path}'. Trying root of this folder..."))
                     try:
-                        url_attempt_2 = f"{data_folder_url}/{file_basename}"
-                        file_response = SPFile.open_binary(ctx, url_attempt_2)
-                        with open(local_file_path, "wb") as f: f.write(file_response.content)
-                        download_successful = True
+                        with tracer.span("fetch from folder root (404 fallback)", "file", path=relative_file_path):
+                            future = fetch_file(row_ctx, manifest_row.root_url, manifest_row.local_file_path, writer, cache, cancel, file_progress, queue,
+                                                contexts=range_contexts)
                         queue.put(("file_info", f"Success! Found '{file_basename}' at the root of '{sharepoint_folder_relative_path}'."))
+                        if file_progress:
+                            file_progress.finish()
+                        return future, errors
+                    except TransferCancelled:
+                        raise
                     except Exception: pass
                 else:
-                    error_message = f"Failed to download '{relative_file_path}'. Non-404 Error: {type(e1).__name__} - {e1}"
-                    queue.put(("file_error", error_message))
-                    with open(error_log_file, "a", encoding='utf-8') as f: f.write(f"{datetime.now().isoformat()} - {error_message}\n")
-                    error_count += 1
+                    errors.append(f"Failed to download '{relative_file_path}'. Non-404 Error: {type(e1).__name__} - {e1}")
+            errors.append(f"Failed to find or download '{relative_file_path}' (tried primary path and root of '{sharepoint_folder_relative_path}').")
+            return None, errors
 
-            if not download_successful:
-                error_message = f"Failed to find or download '{relative_file_path}' (tried primary path and root of '{sharepoint_folder_relative_path}')."
+        rows_done = total_files - len(rows)
+        queue.put(("progress", (rows_done, total_files)))
+        # One future per duplicate row, resolving to the size of the download it saved.
+        saved_writes = []
+        for (manifest_row, other_rows), result in run_jobs(scheduled_groups, lambda g: tracer.profiled(meter.timed, group_size(g), download_row, g[0]),
+                                                           download_workers, stop_event):
+            error_count += _collect_finished_writes(pending_writes, queue, error_log_file)
+            try:
+                future, errors = result.result()
+            except TransferCancelled:
+                continue
+            if future is not None:
+                pending_writes.append((future, manifest_row.relative_file_path))
+                copied_paths = {os.path.normcase(manifest_row.local_file_path)}
+                for other_row in other_rows:
+                    if os.path.normcase(other_row.local_file_path) in copied_paths:
+                        saved_writes.append(future)
+                        continue
+                    copied_paths.add(os.path.normcase(other_row.local_file_path))
+                    # close=True keeps it behind the fetched file's own finishing step when fsyncs are batched.
+                    copy_write = writer.submit(_copy_fetched_file, future, manifest_row.local_file_path, other_row.local_file_path,
+                                               file_path=other_row.local_file_path, close=True)
+                    pending_writes.append((copy_write, other_row.relative_file_path))
+                    saved_writes.append(copy_write)
+            else:
+                errors += [f"Failed to download '{other_row.relative_file_path}' (listed again in the manifest)." if other_row.relative_file_path == manifest_row.relative_file_path
+                           else f"Failed to download '{other_row.relative_file_path}', the same file as '{manifest_row.relative_file_path}'." for other_row in other_rows]
+            for error_message in errors:
                 queue.put(("file_error", error_message))
                 with open(error_log_file, "a", encoding='utf-8') as f: f.write(f"{datetime.now().isoformat()} - {error_message}\n")
                 error_count += 1
+            rows_done += 1 + len(other_rows)
+            queue.put(("progress", (rows_done, total_files)))
+
+        with tracer.span("wait for disk writes"):
+            error_count += _collect_finished_writes(pending_writes, queue, error_log_file, wait=True)
+        if cache:
+            queue.put(("file_info", cache.summary()))
+        if saved_writes:
+            saved_sizes = [future.result() for future in saved_writes if future.exception() is None]
+            queue.put(("file_info", f"Duplicates: {format_count(len(saved_sizes), 'manifest row')} reused a file already downloaded in this run, "
+                                    f"saving {format_count(len(saved_sizes), 'download')} and {format_bytes(sum(saved_sizes))}."))
+        if delta_plan is not None:
+            queue.put(("file_info", f"Delta sync: {unchanged_count} unchanged files skipped, {removed_count} removed from SharePoint."))
 
         if not stop_event.is_set():
+            if byte_progress:
+                byte_progress.flush()
+            cost_fit = meter.cost_fit()
+            if cost_fit:
+                history.record("download", cost_fit, download_workers)
+            schedule_summary = meter.summary() if download_workers > 1 else None
+            if schedule_summary:
+                queue.put(("file_info", schedule_summary))
+            if error_count == 0 and new_change_token:
+                delta_state.set_token(data_folder_url, local_base_dir, new_change_token)
             queue.put(("progress", (total_files, total_files)))
             queue.put(("filename", "All files processed."))
             if error_count == 0:
@@ -126,10 +662,22 @@ def perform_download(sharepoint_url, sharepoint_folder_relative_path, manifest_f
             else:
                 queue.put(("status", f"Download from '{sharepoint_folder_relative_path}' completed with {error_count} errors."))
             queue.put(("done", (local_base_dir, error_count)))
+        else:
+            queue.put(("status", "Download stopped by user."))
+            queue.put(("stopped", (local_base_dir, error_count)))
     except Exception as e:
         detailed_error = f"Error during download from '{sharepoint_folder_relative_path}': {type(e).__name__} - {e}"
         queue.put(("error", detailed_error))
         if error_log_file:
             with open(error_log_file, "a", encoding='utf-8') as f: f.write(f"{datetime.now().isoformat()} - CRITICAL: {detailed_error}\n")
         fallback_dir = local_base_dir if local_base_dir else data_folder_path
-        queue.put(("stopped", (fallback_dir, error_count + 1)))
\ No newline at end of file
+        queue.put(("stopped", (fallback_dir, error_count + 1)))
+    finally:
+        cancel.finish()
+        if writer:
+            writer.shutdown()
+        if cache:
+            cache.close(cancel_pending=stop_event.is_set())
+        if tracing:
+            for trace_path in tracer.finish(output_dir, "download"):
+                queue.put(("file_info", f"Trace written to '{trace_path}'."))
\ No newline at end of file
@@ -1,20 +1,31 @@
+import time
+# Taken before any other import, so startup timings include loading the GUI libraries.
+_APP_START = time.perf_counter()
+
 import customtkinter as ctk
 import threading
 import queue
 import os
 import re
 import json
+import importlib
 import subprocess
+import multiprocessing
 import sys
 from tkinter import messagebox, filedialog
 
 from PIL import Image
 from customtkinter import CTkImage
 
-# Import all logic modules
-from discovery_logic import discover_data_folders, discover_sub_folders
-from download_logic import perform_download
-from upload_logic import perform_upload
+from throttle_logic import bandwidth_limiter, mbps_to_bytes
+from index_logic import FolderIndex, index_path_for_site
+from trace_logic import tracer
+from plan_logic import format_bytes
+
+# The logic modules pull in pandas, paramiko and the office365 client, so they are
+# imported in the background while the splash screen shows (see preload_logic_modules)
+# and imported locally where used.
+LOGIC_MODULES = ("discovery_logic", "download_logic", "upload_logic")
 
 # --- ROBUST HELPER FUNCTIONS FOR PATHS ---
 def get_base_path():
@@ -42,6 +53,30 @@ def get_asset_path(relative_path):
         base_path = get_base_path()
     return os.path.join(base_path, relative_path)
 
+def preload_logic_modules(import_times):
+    """
+    Imports the heavy logic modules, recording how long each took in import_times.
+    Modules imported first also pay for the dependencies they share with later ones.
+    Runs on a background thread, so it must not touch any Tk widgets.
+    """
+    for module_name in LOGIC_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            import_times[module_name] = time.perf_counter() - start
+        except Exception as e:
+            import_times[module_name] = e
+
+def startup_report_lines(import_times, window_ready_seconds):
+    lines = [f"Startup report - main window ready {window_ready_seconds:.2f}s after the app started loading"]
+    for module_name in LOGIC_MODULES:
+        result = import_times.get(module_name)
+        if isinstance(result, Exception):
+            lines.append(f"  {module_name}: FAILED ({type(result).__name__} - {result})")
+        elif result is not None:
+            lines.append(f"  {module_name}: {result:.2f}s")
+    return lines
+
 # --- DIALOG CLASSES (No changes needed in these) ---
 # ... (IdentifierInputDialog, PassphraseDialog, SharePointFolderExplorerDialog, ManifestNameDialog classes remain unchanged from the previous version) ...
 class IdentifierInputDialog(ctk.CTkToplevel):
@@ -87,7 +122,7 @@ class ConfigDialog(ctk.CTkToplevel):
     def __init__(self, parent, config_path):
         super().__init__(parent)
         self.title("Configuration")
-        self.geometry("650x430")
+        self.geometry("650x520")
         self.transient(parent)
         self.grab_set()
         self.config_path = config_path
@@ -101,7 +136,9 @@ class ConfigDialog(ctk.CTkToplevel):
             "SFTP_HOSTNAME": "SFTP Hostname",
             "SFTP_PORT": "SFTP Port",
             "SFTP_USERNAME": "SFTP Username",
-            "SFTP_PRIVATE_KEY_PATH": "SFTP Private Key Path"
+            "SFTP_PRIVATE_KEY_PATH": "SFTP Private Key Path",
+            "CACHE_FOLDER_PATH": "Download Cache Folder (optional)",
+            "CACHE_MAX_GB": "Download Cache Size Limit (GB)"
         }
         self.main_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.main_frame.pack(pady=20, padx=20, fill="both", expand=True)
@@ -121,6 +158,9 @@ class ConfigDialog(ctk.CTkToplevel):
             elif key == "DATA_FOLDER_PATH":
                 browse_button = ctk.CTkButton(self.main_frame, text="Browse...", width=80, command=self.browse_for_data_folder)
                 browse_button.grid(row=i, column=2, padx=(0, 10), pady=8)
+            elif key == "CACHE_FOLDER_PATH":
+                browse_button = ctk.CTkButton(self.main_frame, text="Browse...", width=80, command=self.browse_for_cache_folder)
+                browse_button.grid(row=i, column=2, padx=(0, 10), pady=8)
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.button_frame.pack(pady=10, padx=20, fill="x")
         self.button_frame.grid_columnconfigure((0, 1), weight=1)
@@ -135,6 +175,12 @@ class ConfigDialog(ctk.CTkToplevel):
             entry = self.entries["DATA_FOLDER_PATH"]
             entry.delete(0, "end")
             entry.insert(0, dir_path)
+    def browse_for_cache_folder(self):
+        dir_path = filedialog.askdirectory(title="Select Download Cache Folder")
+        if dir_path:
+            entry = self.entries["CACHE_FOLDER_PATH"]
+            entry.delete(0, "end")
+            entry.insert(0, dir_path)
     def browse_for_key_file(self):
         filepath = filedialog.askopenfilename(title="Select Private Key File",filetypes=(("All files", "*.*"), ("No extension (id_rsa)", "*"), ("PPK files", "*.ppk")))
         if filepath:
@@ -149,7 +195,12 @@ class ConfigDialog(ctk.CTkToplevel):
                 entry.insert(0, config_data.get(key, ""))
         except (FileNotFoundError, json.JSONDecodeError): pass
     def save_config(self):
-        new_config = {}
+        # Start from the existing file so settings without a field here are kept.
+        try:
+            with open(self.config_path, 'r') as f:
+                new_config = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            new_config = {}
         for key, entry in self.entries.items():
             new_config[key] = entry.get()
         try:
@@ -183,6 +234,59 @@ class PassphraseDialog(ctk.CTkToplevel):
         self.master.wait_window(self)
         return self.passphrase
 
+class BandwidthDialog(ctk.CTkToplevel):
+    LIMIT_LABELS = {"total": "Total limit (Mbit/s)", "download": "Download limit (Mbit/s)", "upload": "Upload limit (Mbit/s)"}
+    def __init__(self, parent, config_path):
+        super().__init__(parent)
+        self.title("Speed Limits")
+        self.geometry("420x260")
+        self.transient(parent)
+        self.grab_set()
+        self.parent_app = parent
+        try:
+            with open(config_path, 'r') as f:
+                bandwidth_limiter.configure_from_config(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError): pass
+        self.entries = {}
+        self.main_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.main_frame.pack(pady=(15, 5), padx=20, fill="both", expand=True)
+        self.main_frame.grid_columnconfigure(1, weight=1)
+        current_limits = bandwidth_limiter.current_limits()
+        for i, (name, label_text) in enumerate(self.LIMIT_LABELS.items()):
+            label = ctk.CTkLabel(self.main_frame, text=f"{label_text}:")
+            label.grid(row=i, column=0, padx=10, pady=6, sticky="w")
+            entry = ctk.CTkEntry(self.main_frame, placeholder_text="Unlimited")
+            entry.grid(row=i, column=1, padx=10, pady=6, sticky="ew")
+            if current_limits.get(name):
+                entry.insert(0, f"{current_limits[name] * 8 / 1000 / 1000:g}")
+            self.entries[name] = entry
+        self.info_label = ctk.CTkLabel(self, text="Changes apply immediately to running transfers.", text_color="gray")
+        self.info_label.pack(padx=20)
+        self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.button_frame.pack(pady=(10, 15), padx=20, fill="x")
+        self.button_frame.grid_columnconfigure((0, 1), weight=1)
+        self.apply_button = ctk.CTkButton(self.button_frame, text="Apply", command=self.on_apply)
+        self.apply_button.grid(row=0, column=0, padx=(0, 5), sticky="ew")
+        self.reset_button = ctk.CTkButton(self.button_frame, text="Use Configured Limits", command=self.on_reset, fg_color="gray")
+        self.reset_button.grid(row=0, column=1, padx=(5, 0), sticky="ew")
+    def on_apply(self):
+        limits = {}
+        for name, entry in self.entries.items():
+            value = entry.get().strip()
+            try:
+                mbps = float(value) if value else 0
+            except ValueError:
+                messagebox.showerror("Invalid Input", f"{self.LIMIT_LABELS[name]} must be a number (leave blank for unlimited).", parent=self)
+                return
+            limits[name] = mbps_to_bytes(mbps)
+        bandwidth_limiter.set_override(limits)
+        self.parent_app.log("Speed limits set: " + ", ".join(f"{name} {entry.get().strip() or 'unlimited'}" for name, entry in self.entries.items()))
+        self.destroy()
+    def on_reset(self):
+        bandwidth_limiter.set_override(None)
+        self.parent_app.log("Speed limits reset to the configured values and schedule.")
+        self.destroy()
+
 class SharePointFolderExplorerDialog(ctk.CTkToplevel):
     def __init__(self, parent, sharepoint_url, top_level_folders):
         super().__init__(parent)
@@ -193,7 +297,7 @@ class SharePointFolderExplorerDialog(ctk.CTkToplevel):
         self.path_stack = [("Shared Documents", "")]
         self.sub_folder_queue = queue.Queue()
         self.title("Select SharePoint Folder")
-        self.geometry("500x550")
+        self.geometry("560x600")
         self.transient(parent)
         self.grab_set()
         self.nav_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -203,6 +307,16 @@ class SharePointFolderExplorerDialog(ctk.CTkToplevel):
         self.back_button.grid(row=0, column=0, sticky="w")
         self.path_label = ctk.CTkLabel(self.nav_frame, text=self._get_current_path_display(), anchor="w", wraplength=380)
         self.path_label.grid(row=0, column=1, padx=10, sticky="ew")
+        self.search_entry = ctk.CTkEntry(self, placeholder_text="Search all folders by name or D-number...")
+        self.search_entry.pack(padx=20, pady=(0, 2), fill="x")
+        self.search_entry.bind("<KeyRelease>", self._on_search_changed)
+        self.index_label = ctk.CTkLabel(self, text="", anchor="w", text_color="gray")
+        self.index_label.pack(padx=20, fill="x")
+        self.search_mode = False
+        self.search_after_id = None
+        self.index_path = index_path_for_site(get_base_path(), sharepoint_url)
+        self.search_index = None
+        self.crawl_stop_event = threading.Event()
         self.scroll_frame = ctk.CTkScrollableFrame(self)
         self.scroll_frame.pack(padx=20, pady=5, fill="both", expand=True)
         self.radio_var = ctk.StringVar()
@@ -216,7 +330,58 @@ class SharePointFolderExplorerDialog(ctk.CTkToplevel):
         self.cancel_button.grid(row=0, column=1, padx=(5,0), sticky="ew")
         self.protocol("WM_DELETE_WINDOW", self._on_cancel)
         self._populate_folder_list(top_level_folders)
+        self._start_crawl()
         self._check_sub_folder_queue()
+    def _start_crawl(self):
+        from discovery_logic import crawl_library
+        if os.path.exists(self.index_path):
+            self.index_label.configure(text="Search uses the saved folder index (refreshing in the background...)")
+        else:
+            self.index_label.configure(text="Building folder index for search...")
+        config_path = self.parent_app.get_config_path()
+        threading.Thread(target=crawl_library,
+                         args=(self.sharepoint_url, self.index_path, self.sub_folder_queue, config_path, self.crawl_stop_event),
+                         daemon=True).start()
+    def _on_search_changed(self, event=None):
+        if self.search_after_id:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(150, self._run_search)
+    def _run_search(self):
+        self.search_after_id = None
+        text = self.search_entry.get().strip()
+        if not text:
+            if self.search_mode:
+                self.search_mode = False
+                self._update_view_for_navigation()
+            return
+        try:
+            if self.search_index is None:
+                self.search_index = FolderIndex(self.index_path)
+            results = self.search_index.search(text)
+        except Exception as e:
+            self.index_label.configure(text=f"Search unavailable: {e}")
+            return
+        self.search_mode = True
+        self._clear_folder_list()
+        if not results:
+            label = ctk.CTkLabel(self.scroll_frame, text="No indexed folders match your search.")
+            self.folder_widgets.append(label)
+            label.pack(anchor="w", padx=10, pady=5)
+            return
+        for name, relative_path, item_count, modified in results:
+            frame = ctk.CTkFrame(self.scroll_frame, fg_color="transparent")
+            frame.pack(fill="x", pady=2, padx=5)
+            radio = ctk.CTkRadioButton(frame, text="", variable=self.radio_var, value=relative_path)
+            radio.pack(side="left")
+            nav_button = ctk.CTkButton(frame, text=f"{relative_path}  ({item_count} items)", anchor="w", fg_color="transparent", text_color=ctk.ThemeManager.theme["CTkLabel"]["text_color"],
+                                       command=lambda path=relative_path: self._navigate_to_path(path))
+            nav_button.pack(side="left", fill="x", expand=True)
+            self.folder_widgets.append(frame)
+    def _navigate_to_path(self, relative_path):
+        self.search_entry.delete(0, "end")
+        self.search_mode = False
+        self.path_stack = [("Shared Documents", "")] + [(segment, segment) for segment in relative_path.split("/")]
+        self._update_view_for_navigation()
     def _get_current_path_display(self):
         return "/".join([item[0] for item in self.path_stack])
     def _get_current_path_relative_url(self):
@@ -263,19 +428,30 @@ class SharePointFolderExplorerDialog(ctk.CTkToplevel):
             parent_folder_url += f"/{current_relative_path}"
         
         config_path = self.parent_app.get_config_path()
+        from discovery_logic import discover_sub_folders
         threading.Thread(target=discover_sub_folders, 
                          args=(self.sharepoint_url, parent_folder_url, self.sub_folder_queue, config_path), 
                          daemon=True).start()
     def _check_sub_folder_queue(self):
         try:
-            msg_type, msg_data = self.sub_folder_queue.get_nowait()
-            if msg_type == "sub_folders_found":
-                self._populate_folder_list(msg_data)
-            elif msg_type == "error":
-                self._clear_folder_list()
-                error_label = ctk.CTkLabel(self.scroll_frame, text=f"Error: {msg_data}", text_color="red", wraplength=400)
-                error_label.pack(pady=20)
-                self.folder_widgets.append(error_label)
+            while True:
+                msg_type, msg_data = self.sub_folder_queue.get_nowait()
+                if msg_type == "sub_folders_found":
+                    if not self.search_mode:
+                        self._populate_folder_list(msg_data)
+                elif msg_type == "error":
+                    self._clear_folder_list()
+                    error_label = ctk.CTkLabel(self.scroll_frame, text=f"Error: {msg_data}", text_color="red", wraplength=400)
+                    error_label.pack(pady=20)
+                    self.folder_widgets.append(error_label)
+                elif msg_type == "crawl_progress":
+                    self.index_label.configure(text=f"Indexing folders for search... {msg_data} found so far")
+                elif msg_type == "crawl_done":
+                    self.index_label.configure(text=f"Folder index up to date ({msg_data} folders).")
+                    if self.search_mode:
+                        self._run_search()
+                elif msg_type == "crawl_error":
+                    self.parent_app.log(f"⚠️ Folder index: {msg_data}")
         except queue.Empty:
             pass
         finally:
@@ -285,13 +461,23 @@ class SharePointFolderExplorerDialog(ctk.CTkToplevel):
         if not selected_name:
             messagebox.showwarning("No Selection", "Please select a folder to download.", parent=self)
             return
-        current_relative_path = self._get_current_path_relative_url()
-        self.selected_folder_path = f"{current_relative_path}/{selected_name}" if current_relative_path else selected_name
-        self.selected_folder_name = selected_name
-        self.destroy()
+        if self.search_mode:
+            # Search results carry the full path under 'Shared Documents'.
+            self.selected_folder_path = selected_name
+            self.selected_folder_name = selected_name.split("/")[-1]
+        else:
+            current_relative_path = self._get_current_path_relative_url()
+            self.selected_folder_path = f"{current_relative_path}/{selected_name}" if current_relative_path else selected_name
+            self.selected_folder_name = selected_name
+        self._close()
     def _on_cancel(self):
         self.selected_folder_path = None
         self.selected_folder_name = None
+        self._close()
+    def _close(self):
+        self.crawl_stop_event.set()
+        if self.search_index:
+            self.search_index.close()
         self.destroy()
     def get_selection(self):
         self.master.wait_window(self)
@@ -345,6 +531,9 @@ class App(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.withdraw()
+        self.import_times = {}
+        self.preload_thread = threading.Thread(target=preload_logic_modules, args=(self.import_times,), daemon=True)
+        self.preload_thread.start()
         self.create_splash_screen()
         
         self.title("Data Transfer Hub")
@@ -362,6 +551,9 @@ class App(ctk.CTk):
             
         self.process_queue = queue.Queue()
         self.stop_event = threading.Event()
+        self.transfer_worker = None
+        self.files_progress = (0, 0)
+        self.bytes_progress = None
         self.download_folder_path = None
         self.web_properties = None
 
@@ -386,13 +578,17 @@ class App(ctk.CTk):
         
         self.top_button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.top_button_frame.grid(row=4, column=0, padx=20, pady=(10, 5), sticky="ew")
-        self.top_button_frame.grid_columnconfigure((0, 1), weight=1)
+        self.top_button_frame.grid_columnconfigure((0, 1, 2), weight=1)
         
         self.config_button = ctk.CTkButton(self.top_button_frame, text="Edit Configuration", command=self.open_config_window)
         self.config_button.grid(row=0, column=0, padx=(0, 5), sticky="ew")
         
         self.open_folder_button = ctk.CTkButton(self.top_button_frame, text="Open Data Folder", command=self.open_download_folder, state="normal")
-        self.open_folder_button.grid(row=0, column=1, padx=(5, 0), sticky="ew")
+        self.open_folder_button.grid(row=0, column=1, padx=5, sticky="ew")
+        
+        # Left enabled during transfers so limits can be changed while they run.
+        self.speed_limit_button = ctk.CTkButton(self.top_button_frame, text="Speed Limits", command=self.open_bandwidth_window)
+        self.speed_limit_button.grid(row=0, column=2, padx=(5, 0), sticky="ew")
         
         self.action_button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.action_button_frame.grid(row=5, column=0, padx=20, pady=5, sticky="ew")
@@ -406,6 +602,12 @@ class App(ctk.CTk):
         self.upload_button = ctk.CTkButton(self.action_button_frame, text="Start Upload", command=self.start_upload_process)
         self.upload_button.grid(row=0, column=1, padx=(5, 0), sticky="ew")
         
+        self.delta_sync_checkbox = ctk.CTkCheckBox(self.action_button_frame, text="Delta sync (only re-download files changed since the last run)")
+        self.delta_sync_checkbox.grid(row=1, column=0, columnspan=2, pady=(8, 0), sticky="w")
+        
+        self.dry_run_checkbox = ctk.CTkCheckBox(self.action_button_frame, text="Dry run (check the manifest against SharePoint without downloading)")
+        self.dry_run_checkbox.grid(row=2, column=0, columnspan=2, pady=(8, 0), sticky="w")
+        
         self.log_box = ctk.CTkTextbox(self, state="disabled", wrap="word")
         self.log_box.grid(row=6, column=0, padx=20, pady=5, sticky="nsew")
         self.grid_rowconfigure(6, weight=1)
@@ -425,8 +627,20 @@ class App(ctk.CTk):
         self.progress_bar.set(0)
         self.progress_bar.grid(row=2, column=0, pady=(5,0), sticky="ew")
         
+        # Per-destination counts when uploading to several SFTP targets at once.
+        self.targets_label = ctk.CTkLabel(self.progress_frame, text="", anchor="w", text_color="gray")
+        self.targets_label.grid(row=3, column=0, sticky="ew")
+        
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.check_queue()
 
+    def on_close(self):
+        # Stops a running transfer and ends the transfer process before the window goes.
+        self.stop_event.set()
+        if self.transfer_worker:
+            self.transfer_worker.shutdown()
+        self.destroy()
+
     def _browse_for_config(self):
         filepath = filedialog.askopenfilename(
             title="Select Configuration File",
@@ -462,16 +676,46 @@ class App(ctk.CTk):
             splash_label = ctk.CTkLabel(splash_win, image=splash_image, text="", fg_color=transparent_color)
             splash_label.pack()
             self.splash_win = splash_win
-            splash_win.after(4000, self.show_main_window)
+            self._wait_for_preload()
         except Exception as e:
             print(f"Splash screen image not found: {e}. Skipping.")
             if hasattr(self, 'splash_win'): splash_win.destroy()
             self.show_main_window()
             
+    def _wait_for_preload(self):
+        if self.preload_thread.is_alive():
+            self.after(50, self._wait_for_preload)
+        else:
+            self.show_main_window()
+
     def show_main_window(self):
         if hasattr(self, 'splash_win') and self.splash_win.winfo_exists():
             self.splash_win.destroy()
         self.deiconify()
+        self.window_ready_seconds = time.perf_counter() - _APP_START
+        self.after_idle(self._report_startup_time)
+
+    def _report_startup_time(self):
+        if self.preload_thread.is_alive():
+            # The splash was skipped, so imports are still running; report once they finish.
+            self.after(200, self._report_startup_time)
+            return
+        lines = startup_report_lines(self.import_times, self.window_ready_seconds)
+        self.log(lines[0])
+        try:
+            with open(self.get_config_path(), 'r') as f:
+                write_report = str(json.load(f).get("STARTUP_REPORT") or "").strip().lower() in ("1", "true", "yes", "on")
+        except (OSError, ValueError):
+            write_report = False
+        if not write_report:
+            return
+        # Next to the download and upload error logs.
+        report_path = os.path.join(get_base_path(), "startup_report.txt")
+        try:
+            with open(report_path, "w", encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            self.log(f"Warning: Could not write the startup report to '{report_path}'. ({e})")
         
     def open_config_window(self):
         config_path = self.get_config_path()
@@ -479,6 +723,9 @@ class App(ctk.CTk):
              self.log(f"Info: Config file not found at '{config_path}'. A new one will be created upon saving.")
         ConfigDialog(self, config_path=config_path)
         
+    def open_bandwidth_window(self):
+        BandwidthDialog(self, config_path=self.get_config_path())
+        
     def get_data_folder_path(self):
         """
         Gets the data folder path. Prefers the path from config.json,
@@ -502,6 +749,9 @@ class App(ctk.CTk):
     def set_ui_for_processing(self, is_uploading=False, is_discovery=False):
         self.stop_event.clear()
         self.progress_bar.set(0)
+        self.files_progress = (0, 0)
+        self.bytes_progress = None
+        self.targets_label.configure(text="")
         if not is_discovery:
             self.log_box.configure(state="normal")
             self.log_box.delete("1.0", "end")
@@ -510,6 +760,8 @@ class App(ctk.CTk):
         self.upload_button.configure(state="disabled")
         self.config_button.configure(state="disabled")
         self.open_folder_button.configure(state="disabled")
+        self.delta_sync_checkbox.configure(state="disabled")
+        self.dry_run_checkbox.configure(state="disabled")
         if is_discovery:
             self.download_button.configure(text="Discovering...")
             return
@@ -523,6 +775,8 @@ class App(ctk.CTk):
         self.upload_button.configure(text="Start Upload", command=self.start_upload_process, state="normal", fg_color=self.original_button_color, hover_color=self.original_hover_color)
         self.config_button.configure(state="normal")
         self.open_folder_button.configure(state="normal")
+        self.delta_sync_checkbox.configure(state="normal")
+        self.dry_run_checkbox.configure(state="normal")
         
     def stop_process(self):
         self.log("Sending stop signal...")
@@ -545,6 +799,7 @@ class App(ctk.CTk):
 
         self.set_ui_for_processing(is_discovery=True)
         self.log("Starting discovery process...")
+        from discovery_logic import discover_data_folders
         threading.Thread(target=discover_data_folders, args=(url, self.process_queue, config_path), daemon=True).start()
 
     def show_folder_explorer_dialog(self, top_level_folders):
@@ -603,9 +858,31 @@ class App(ctk.CTk):
         self.log(f"Starting download for SharePoint folder '{sharepoint_folder_relative_path}'.")
         self.log(f"Using manifest file: '{manifest_filename}'.")
         self.log(f"Local data will be saved to a subfolder named '{local_folder_id}' within: {data_folder_path}")
-        threading.Thread(target=perform_download,
-                         args=(url, sharepoint_folder_relative_path, manifest_filename, local_folder_id, data_folder_path, self.process_queue, self.stop_event, config_path, output_dir),
-                         daemon=True).start()
+        delta_sync = bool(self.delta_sync_checkbox.get())
+        if delta_sync:
+            self.log("Delta sync is on: files already downloaded are only fetched again if SharePoint reports a change.")
+        dry_run = bool(self.dry_run_checkbox.get())
+        if dry_run:
+            self.log("Dry run: the manifest is checked against SharePoint and nothing is downloaded.")
+        self.start_transfer("download_logic", "perform_download",
+                            sharepoint_url=url, sharepoint_folder_relative_path=sharepoint_folder_relative_path,
+                            manifest_filename=manifest_filename, local_folder_id=local_folder_id,
+                            data_folder_path=data_folder_path, config_path=config_path, output_dir=output_dir,
+                            delta_sync=delta_sync, dry_run=dry_run)
+
+    def start_transfer(self, module_name, function_name, **kwargs):
+        """
+        Runs a perform_* function with the GUI's queue and stop event, either on a thread
+        or, with RUN_TRANSFERS_IN_PROCESS set, in the separate transfer process.
+        """
+        from worker_process_logic import TransferWorker, transfers_in_process
+        if transfers_in_process(kwargs["config_path"]):
+            if self.transfer_worker is None:
+                self.transfer_worker = TransferWorker(self.process_queue, self.stop_event)
+            self.transfer_worker.run(module_name, function_name, **kwargs)
+            return
+        function = getattr(importlib.import_module(module_name), function_name)
+        threading.Thread(target=function, kwargs=dict(kwargs, queue=self.process_queue, stop_event=self.stop_event), daemon=True).start()
     
     def start_upload_process(self):
         config_path = self.get_config_path()
@@ -651,17 +928,26 @@ class App(ctk.CTk):
         dialog.protocol("WM_DELETE_WINDOW", on_cancel)
         
     def get_passphrase_and_run_upload(self, folder_name):
-        dialog = PassphraseDialog(self)
-        passphrase = dialog.get_passphrase()
-        if passphrase is not None:
-            data_folder_path = self.get_data_folder_path()
-            local_path = os.path.join(data_folder_path, folder_name)
-            config_path = self.get_config_path()
-            output_dir = get_base_path()
-            
-            self.set_ui_for_processing(is_uploading=True)
-            self.log(f"Starting upload for '{folder_name}'...")
-            threading.Thread(target=perform_upload, args=(local_path, self.process_queue, self.stop_event, passphrase, config_path, output_dir), daemon=True).start()
+        from upload_logic import keys_already_unlocked
+        has_key = self.transfer_worker.has_key if self.transfer_worker else None
+        if keys_already_unlocked(self.get_config_path(), has_key):
+            # The pooled connections keep the decrypted key for the rest of the session.
+            self.log("Using the SFTP key unlocked earlier in this session.")
+            passphrase = None
+        else:
+            dialog = PassphraseDialog(self)
+            passphrase = dialog.get_passphrase()
+            if passphrase is None:
+                return
+        data_folder_path = self.get_data_folder_path()
+        local_path = os.path.join(data_folder_path, folder_name)
+        config_path = self.get_config_path()
+        output_dir = get_base_path()
+        
+        self.set_ui_for_processing(is_uploading=True)
+        self.log(f"Starting upload for '{folder_name}'...")
+        self.start_transfer("upload_logic", "perform_upload", local_source_path=local_path, passphrase=passphrase,
+                            config_path=config_path, output_dir=output_dir)
             
     def log(self, message):
         self.log_box.configure(state="normal")
@@ -677,41 +963,65 @@ class App(ctk.CTk):
             message = f"The {title.lower()} process finished with {error_count} unresolved error{plural}.\n\nPlease check '{title.lower()}_errors.txt' for details."
         messagebox.showinfo(f"{title} Finished", message)
 
+    def _bytes_progress_text(self):
+        if self.bytes_progress is None:
+            return ""
+        done_bytes, total_bytes = self.bytes_progress
+        return f" - {format_bytes(done_bytes)} of {format_bytes(total_bytes)}"
+
     def check_queue(self):
         try:
             while True:
                 msg_type, msg_data = self.process_queue.get_nowait()
-                if msg_type == "web_props":
-                    self.web_properties = msg_data
-                elif msg_type == "folders_found":
-                    self.log("✅ Discovery complete. Please select a folder.")
-                    self.status_label.configure(text="Status: Awaiting selection...")
-                    self.reset_ui_from_processing()
-                    self.show_folder_explorer_dialog(msg_data)
-                elif msg_type == "status":
-                    self.status_label.configure(text=f"Status: {msg_data}")
-                    self.log(f"Status: {msg_data}")
-                elif msg_type == "filename":
-                    self.filename_label.configure(text=msg_data)
-                elif msg_type == "progress":
-                    current, total = msg_data
-                    self.progress_bar.set(current / total if total > 0 else 0)
-                    self.status_label.configure(text=f"Status: Processing... ({current}/{total})")
-                elif msg_type == "done" or msg_type == "stopped":
-                    is_upload = "upload" in self.status_label.cget("text").lower() or (self.filename_label.cget("text") and "upload" in self.filename_label.cget("text").lower())
-                    title = "Upload" if is_upload else "Download"
-                    self.download_folder_path, error_count = msg_data
-                    self.reset_ui_from_processing()
-                    self.status_label.configure(text=f"Status: {title} Complete!")
-                    self.show_completion_popup(title, error_count)
-                elif msg_type == "file_info":
-                    self.log(f"ℹ️ {msg_data}")
-                elif msg_type == "file_error":
-                    self.log(f"⚠️ {msg_data}")
-                elif msg_type == "error":
-                    self.log(f"❌ CRITICAL ERROR: {msg_data}")
-                    self.status_label.configure(text="Status: Critical Error!")
-                    self.reset_ui_from_processing()
+                # Shows in a job trace how long the GUI spends on each worker message.
+                with tracer.span(msg_type, "gui"):
+                    if msg_type == "web_props":
+                        self.web_properties = msg_data
+                    elif msg_type == "folders_found":
+                        self.log("✅ Discovery complete. Please select a folder.")
+                        self.status_label.configure(text="Status: Awaiting selection...")
+                        self.reset_ui_from_processing()
+                        self.show_folder_explorer_dialog(msg_data)
+                    elif msg_type == "status":
+                        self.status_label.configure(text=f"Status: {msg_data}")
+                        self.log(f"Status: {msg_data}")
+                    elif msg_type == "filename":
+                        self.filename_label.configure(text=msg_data)
+                    elif msg_type == "progress":
+                        current, total = msg_data
+                        self.files_progress = (current, total)
+                        if self.bytes_progress is None:
+                            self.progress_bar.set(current / total if total > 0 else 0)
+                        self.status_label.configure(text=f"Status: Processing... ({current}/{total}){self._bytes_progress_text()}")
+                    elif msg_type == "byte_progress":
+                        # Sent when the job knows its total size; the bar then follows bytes rather than files.
+                        self.bytes_progress = msg_data
+                        done_bytes, total_bytes = msg_data
+                        self.progress_bar.set(done_bytes / total_bytes if total_bytes > 0 else 0)
+                        current, total = self.files_progress
+                        self.status_label.configure(text=f"Status: Processing... ({current}/{total}){self._bytes_progress_text()}")
+                    elif msg_type == "preflight_done":
+                        self.reset_ui_from_processing()
+                        self.status_label.configure(text="Status: Preflight Complete!")
+                        messagebox.showinfo("Preflight Finished", "\n\n".join(msg_data))
+                    elif msg_type == "done" or msg_type == "stopped":
+                        is_upload = "upload" in self.status_label.cget("text").lower() or (self.filename_label.cget("text") and "upload" in self.filename_label.cget("text").lower())
+                        title = "Upload" if is_upload else "Download"
+                        self.download_folder_path, error_count = msg_data
+                        self.reset_ui_from_processing()
+                        self.status_label.configure(text=f"Status: {title} Complete!")
+                        self.show_completion_popup(title, error_count)
+                    elif msg_type == "target_progress":
+                        parts = [f"{name}: dropped" if failed else f"{name}: {done}/{total}" for name, done, total, failed in msg_data]
+                        self.targets_label.configure(text="   ".join(parts))
+                    elif msg_type == "file_info":
+                        self.log(f"ℹ️ {msg_data}")
+                    elif msg_type == "file_error":
+                        self.log(f"⚠️ {msg_data}")
+                    elif msg_type == "error":
+                        self.log(f"❌ CRITICAL ERROR: {msg_data}")
+                        self.status_label.configure(text="Status: Critical Error!")
+                        self.reset_ui_from_processing()
         except queue.Empty:
             pass
         finally:
@@ -742,5 +1052,7 @@ class App(ctk.CTk):
 
 
 if __name__ == "__main__":
+    # Needed by the transfer process (RUN_TRANSFERS_IN_PROCESS) in the packaged executable.
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# Folders whose modified time and item count are unchanged are only re-listed after this long.
+FULL_RECRAWL_SECONDS = 24 * 60 * 60
+SEARCH_RESULT_LIMIT = 200
+
+def index_path_for_site(base_dir, sharepoint_url):
+    """Each SharePoint site gets its own index file next to the application."""
+    site_hash = hashlib.sha1(sharepoint_url.strip().rstrip('/').lower().encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base_dir, f"folder_index_{site_hash}.sqlite")
+
+class FolderIndex:
+    """
+    A local SQLite index of every folder in a document library, with item counts and
+    modified times, so folders can be searched by name or D-number without asking
+    SharePoint. Each thread should open its own FolderIndex.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                server_relative_url TEXT PRIMARY KEY,
+                parent_url TEXT NOT NULL,
+                name TEXT NOT NULL,
+                relative_path TEXT NOT NULL,
+                item_count INTEGER,
+                modified TEXT,
+                listed_at REAL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS folders_parent ON folders(parent_url)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def folder_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM folders").fetchone()[0]
+
+    def update_children(self, parent_url, library_url, children):
+        """
+        Records the current sub-folders of parent_url, given as (name, server-relative
+        URL, item count, modified) tuples, and drops folders that no longer exist
+        (with everything indexed beneath them). Returns (needs_listing, unchanged):
+        the URLs of children that need their own contents listed (new, changed, never
+        listed, or not listed for a long time) and of those that do not.
+        """
+        now = time.time()
+        existing = {row[0]: row[1:] for row in self.conn.execute(
+            "SELECT server_relative_url, item_count, modified, listed_at FROM folders WHERE parent_url = ?", (parent_url,))}
+        needs_listing = []
+        unchanged = []
+        with self.conn:
+            for name, url, item_count, modified in children:
+                relative_path = url[len(library_url):].lstrip('/')
+                previous = existing.pop(url, None)
+                if previous is None:
+                    self.conn.execute("INSERT INTO folders VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                                      (url, parent_url, name, relative_path, item_count, modified))
+                    needs_listing.append(url)
+                    continue
+                old_count, old_modified, listed_at = previous
+                if old_count != item_count or old_modified != modified or not listed_at or now - listed_at > FULL_RECRAWL_SECONDS:
+                    needs_listing.append(url)
+                else:
+                    unchanged.append(url)
+                self.conn.execute("UPDATE folders SET name = ?, relative_path = ?, item_count = ?, modified = ? WHERE server_relative_url = ?",
+                                  (name, relative_path, item_count, modified, url))
+            for removed_url in existing:
+                self.conn.execute("DELETE FROM folders WHERE server_relative_url = ? OR server_relative_url LIKE ? ESCAPE '\\'",
+                                  (removed_url, _like_escape(removed_url) + "/%"))
+        return needs_listing, unchanged
+
+    def mark_listed(self, url):
+        with self.conn:
+            self.conn.execute("UPDATE folders SET listed_at = ? WHERE server_relative_url = ?", (time.time(), url))
+
+    def known_children(self, parent_url):
+        """Sub-folder URLs already indexed under parent_url, for folders that are not re-listed."""
+        return [row[0] for row in self.conn.execute("SELECT server_relative_url FROM folders WHERE parent_url = ?", (parent_url,))]
+
+    def search(self, text, limit=SEARCH_RESULT_LIMIT):
+        """
+        Returns (name, relative path, item count, modified) for folders whose name
+        contains the text, case-insensitively, shortest paths first.
+        """
+        pattern = f"%{_like_escape(text.strip())}%"
+        return self.conn.execute(
+            "SELECT name, relative_path, item_count, modified FROM folders WHERE name LIKE ? ESCAPE '\\' "
+            "ORDER BY LENGTH(relative_path), relative_path LIMIT ?", (pattern, limit)).fetchall()
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
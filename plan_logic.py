@@ -0,0 +1,262 @@
+import os
+import time
+import heapq
+import threading
+from collections import deque, namedtuple
+
+import resume_logic
+
+PlanEntry = namedtuple("PlanEntry", ["local_path", "remote_path", "size", "mtime"])
+# A download manifest row: where it goes locally, its own URL and the folder-root URL tried after a 404.
+ManifestRow = namedtuple("ManifestRow", ["relative_file_path", "local_file_path", "primary_url", "root_url"])
+
+# Orders TRANSFER_ORDER can ask for. largest_first only changes anything with several workers.
+TRANSFER_ORDERS = ("largest_first", "as_listed")
+DEFAULT_TRANSFER_ORDER = "largest_first"
+BYTE_PROGRESS_INTERVAL = 0.5
+
+class TransferPlan:
+    """
+    The files and directories of one local data folder, with totals, as produced by
+    a single scan. Remote directories are listed parents first, so they can be
+    created in order. unreadable holds (local path, error) for anything the scan
+    could not read, which is left out of the plan.
+    """
+    def __init__(self, local_root, remote_base_dir):
+        self.local_root = local_root
+        self.remote_base_dir = remote_base_dir
+        self.directories = []
+        self.entries = []
+        self.unreadable = []
+        self.total_bytes = 0
+
+    @property
+    def total_files(self):
+        return len(self.entries)
+
+    def add_file(self, local_path, remote_path, size, mtime):
+        self.entries.append(PlanEntry(local_path, remote_path, size, mtime))
+        self.total_bytes += size
+
+def build_upload_plan(local_source_path, remote_base_dir=None):
+    """
+    Scans a local data folder once with os.scandir and returns a TransferPlan of
+    (local path, remote path, size, mtime) entries. Temporary '.dth-part' files from
+    interrupted downloads are left out, as are sub-folders and files that cannot be
+    read (listed in plan.unreadable). An unreadable local_source_path raises.
+    """
+    if remote_base_dir is None:
+        remote_base_dir = os.path.basename(os.path.normpath(local_source_path))
+    plan = TransferPlan(local_source_path, remote_base_dir)
+    pending_dirs = deque([(local_source_path, remote_base_dir)])
+    while pending_dirs:
+        local_dir, remote_dir = pending_dirs.popleft()
+        try:
+            with os.scandir(local_dir) as dir_entries:
+                dir_entries = sorted(dir_entries, key=lambda e: e.name)
+        except OSError as e:
+            if local_dir == local_source_path:
+                raise
+            plan.unreadable.append((local_dir, e))
+            continue
+        for dir_entry in dir_entries:
+            remote_path = f"{remote_dir}/{dir_entry.name}"
+            if dir_entry.is_dir(follow_symlinks=False):
+                plan.directories.append(remote_path)
+                pending_dirs.append((dir_entry.path, remote_path))
+            elif dir_entry.is_file() and not resume_logic.is_partial_artifact(dir_entry.name):
+                try:
+                    stat = dir_entry.stat()
+                except OSError as e:
+                    plan.unreadable.append((dir_entry.path, e))
+                    continue
+                plan.add_file(dir_entry.path, remote_path, stat.st_size, stat.st_mtime)
+    return plan
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+def format_count(count, noun):
+    """'1 file', '2 files': count with the noun pluralised by adding 's'."""
+    return f"{count} {noun}{'s' if count != 1 else ''}"
+
+def format_duration(seconds):
+    if seconds < 10:
+        return f"{seconds:.1f}s"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds // 60 % 60:02d}m"
+
+def transfer_order_from_config(config, queue=None):
+    """TRANSFER_ORDER, or the default (reported to queue as file_info) if it is not a known order."""
+    order = str(config.get("TRANSFER_ORDER", "") or DEFAULT_TRANSFER_ORDER).strip().lower()
+    if order not in TRANSFER_ORDERS:
+        if queue is not None:
+            queue.put(("file_info", f"TRANSFER_ORDER must be one of {', '.join(TRANSFER_ORDERS)}, not '{order}'. Using {DEFAULT_TRANSFER_ORDER}."))
+        return DEFAULT_TRANSFER_ORDER
+    return order
+
+def int_from_config(config, key, default, queue=None, minimum=0):
+    """A whole-number setting, or default (reported to queue as file_info) if it is invalid."""
+    value = config.get(key, "")
+    if value is None or str(value).strip() == "":
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        if queue is not None:
+            queue.put(("file_info", f"{key} must be a whole number{f' of at least {minimum}' if minimum else ''}, not '{value}'. Using {default}."))
+        return default
+    return number
+
+def order_by_size(items, size_of, order):
+    """
+    Returns items in the order they should be started. largest_first starts the biggest
+    files first so the small ones fill in around them, rather than a big file listed
+    last running on alone while the other workers sit idle. Files of unknown size
+    (size_of returns None) keep their listed order after the rest.
+    """
+    if order == "as_listed":
+        return list(items)
+    return sorted(items, key=lambda item: (size_of(item) is None, -(size_of(item) or 0)))
+
+def projected_makespan(sizes, workers, file_seconds):
+    """
+    Simulates handing files, in the given order, to whichever of workers frees up
+    first, where a file takes file_seconds(size). Returns when the last one finishes.
+    """
+    finish_times = [0.0] * max(1, min(workers, len(sizes)))
+    for size in sizes:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + file_seconds(size))
+    return max(finish_times)
+
+def fit_file_cost(samples):
+    """
+    Least-squares fit of seconds = overhead + size * seconds_per_byte over (size, seconds)
+    samples, ignoring those of unknown size. Returns (overhead, seconds_per_byte,
+    mean_size), or None without samples.
+    """
+    samples = [(size, seconds) for size, seconds in samples if size is not None]
+    if not samples:
+        return None
+    count = len(samples)
+    mean_size = sum(size for size, _ in samples) / count
+    mean_seconds = sum(seconds for _, seconds in samples) / count
+    variance = sum((size - mean_size) ** 2 for size, _ in samples)
+    per_byte = sum((size - mean_size) * (seconds - mean_seconds) for size, seconds in samples) / variance if variance else 0
+    if per_byte <= 0:
+        # All the same size, or too noisy to separate overhead from throughput.
+        per_byte, overhead = (mean_seconds / mean_size, 0) if mean_size else (0, mean_seconds)
+    else:
+        overhead = max(0, mean_seconds - per_byte * mean_size)
+    return overhead, per_byte, mean_size
+
+def file_cost(overhead, seconds_per_byte, mean_size):
+    """The seconds a file of a given size takes under a fit; unknown sizes count as the mean."""
+    return lambda size: overhead + seconds_per_byte * (mean_size if size is None else size)
+
+class MakespanMeter:
+    """
+    Times each file a transfer's workers handle. At the end, fits a per-file cost
+    (fixed overhead plus bytes over throughput) to those timings and uses it to
+    project how long the schedule should have taken, and how long the listed order
+    would have, to set against the actual elapsed time.
+    """
+    def __init__(self, order, workers, listed_sizes, scheduled_sizes):
+        self.order = order
+        self.workers = workers
+        self.listed_sizes = list(listed_sizes)
+        self.scheduled_sizes = list(scheduled_sizes)
+        self.samples = []
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def timed(self, size, function, *args, **kwargs):
+        """Calls function(*args, **kwargs), recording how long it took against size."""
+        start = time.monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.samples.append((size, time.monotonic() - start))
+
+    def cost_fit(self):
+        """fit_file_cost() over the files timed so far."""
+        with self.lock:
+            return fit_file_cost(self.samples)
+
+    def summary(self):
+        """A one-line projected vs actual makespan report, or None if nothing was timed."""
+        elapsed = time.monotonic() - self.started
+        fit = self.cost_fit()
+        if fit is None:
+            return None
+        file_seconds = file_cost(*fit)
+        projected = projected_makespan(self.scheduled_sizes, self.workers, file_seconds)
+        text = (f"Schedule ({self.order.replace('_', ' ')}, {self.workers} at a time): "
+                f"projected {format_duration(projected)}, actual {format_duration(elapsed)}")
+        if self.order != "as_listed":
+            text += f"; in listed order about {format_duration(projected_makespan(self.listed_sizes, self.workers, file_seconds))}"
+        unknown = sum(1 for size in self.scheduled_sizes if size is None)
+        if unknown:
+            text += f" ({unknown} file{'s' if unknown != 1 else ''} of unknown size)"
+        return text + "."
+
+class ByteProgress:
+    """
+    Counts bytes as they arrive from any worker thread and sends ("byte_progress",
+    (bytes_done, total_bytes)) to the GUI at most every BYTE_PROGRESS_INTERVAL seconds.
+    """
+    def __init__(self, total_bytes, queue):
+        self.total_bytes = total_bytes
+        self.queue = queue
+        self.done = 0
+        self.last_sent = 0
+        self.lock = threading.Lock()
+
+    def add(self, num_bytes):
+        with self.lock:
+            self.done += num_bytes
+            now = time.monotonic()
+            if now - self.last_sent < BYTE_PROGRESS_INTERVAL:
+                return
+            self.last_sent = now
+            message = ("byte_progress", (min(self.done, self.total_bytes), self.total_bytes))
+        self.queue.put(message)
+
+    def for_file(self, size):
+        return _FileProgress(self, size)
+
+    def flush(self):
+        with self.lock:
+            message = ("byte_progress", (min(self.done, self.total_bytes), self.total_bytes))
+        self.queue.put(message)
+
+class _FileProgress:
+    """One file's share of a ByteProgress. finish() counts whatever did not stream (cache hits, resumed ranges)."""
+    def __init__(self, progress, size):
+        self.progress = progress
+        self.size = size or 0
+        self.counted = 0
+        self.lock = threading.Lock()
+
+    def add(self, num_bytes):
+        # Large files stream several ranges at once, so this is called from more than one thread.
+        with self.lock:
+            self.counted += num_bytes
+        self.progress.add(num_bytes)
+
+    def finish(self):
+        with self.lock:
+            remainder, self.counted = max(0, self.size - self.counted), max(self.counted, self.size)
+        if remainder:
+            self.progress.add(remainder)
@@ -0,0 +1,125 @@
+import os
+import json
+from datetime import datetime
+
+from plan_logic import file_cost, format_bytes, format_count, format_duration, order_by_size, projected_makespan
+
+THROUGHPUT_HISTORY_FILENAME = "throughput_history.json"
+# How many duplicate or missing paths are listed by name in a preflight report.
+REPORT_EXAMPLES = 5
+
+def _rows(count):
+    return format_count(count, "row")
+
+def group_by_source(rows, preflight=None):
+    """
+    Groups manifest rows that fetch the same SharePoint file: rows listing the same
+    path, or different paths that resolve to one file through the folder-root
+    fallback. Rows are matched on the URL the preflight resolved them to, or their
+    own URL if it could not. Returns [(row to fetch, [other rows])] in manifest order.
+    """
+    groups = {}
+    for row in rows:
+        resolved = preflight.resolve(row) if preflight else None
+        source_url = (resolved[0] if resolved else row.primary_url).lower()
+        if source_url in groups:
+            groups[source_url][1].append(row)
+        else:
+            groups[source_url] = (row, [])
+    return list(groups.values())
+
+class ThroughputHistory:
+    """
+    The per-file cost (overhead plus seconds per byte) measured on the last completed
+    download, kept next to the app so a dry run can project how long a job will take.
+    """
+    def __init__(self, history_path):
+        self.history_path = history_path
+        try:
+            with open(history_path, 'r', encoding='utf-8') as f:
+                self.history = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.history = {}
+
+    def record(self, direction, fit, workers):
+        overhead, seconds_per_byte, mean_size = fit
+        self.history[direction] = {"overhead_seconds": overhead, "seconds_per_byte": seconds_per_byte, "mean_size": mean_size,
+                                   "workers": workers, "recorded_at": datetime.now().isoformat()}
+        temp_path = self.history_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.history, f, indent=2)
+        os.replace(temp_path, self.history_path)
+
+    def projected_seconds(self, direction, sizes, workers):
+        """How long files of these sizes (in start order) should take, or None if nothing has been measured yet."""
+        entry = self.history.get(direction)
+        if not entry:
+            return None
+        cost = file_cost(entry["overhead_seconds"], entry["seconds_per_byte"], entry["mean_size"])
+        return projected_makespan(sizes, workers, cost)
+
+class Preflight:
+    """
+    What each manifest row resolves to in a single listing of the data folder: its own
+    path, the folder root (the fallback perform_download makes after a 404), or nothing.
+    Also notes rows that would write to the same local path.
+    """
+    def __init__(self, rows, listing):
+        self.rows = rows
+        self.resolved = {}
+        self.missing = []
+        self.root_fallbacks = []
+        self.duplicate_paths = []
+        seen_paths = set()
+        for row in rows:
+            for url in (row.primary_url, row.root_url):
+                entry = listing.get(url.lower())
+                if entry is not None:
+                    self.resolved[row] = (url, entry[0], entry[1])
+                    if url != row.primary_url:
+                        self.root_fallbacks.append(row)
+                    break
+            else:
+                self.missing.append(row)
+            path_key = os.path.normcase(os.path.normpath(row.local_file_path))
+            if path_key in seen_paths:
+                self.duplicate_paths.append(row)
+            seen_paths.add(path_key)
+
+    def resolve(self, row):
+        """(url, size, version) the row resolves to, or None if it was not found in the listing."""
+        return self.resolved.get(row)
+
+    def size_of(self, row):
+        resolved = self.resolved.get(row)
+        return resolved[1] if resolved else None
+
+    @property
+    def total_bytes(self):
+        return sum(self.size_of(row) or 0 for row in self.rows)
+
+    def report(self, history, workers, order):
+        """The lines of a dry-run report."""
+        found = len(self.rows) - len(self.missing)
+        lines = [f"Preflight: {found} of {len(self.rows)} manifest rows found on SharePoint, {format_bytes(self.total_bytes)} in total."]
+        if self.root_fallbacks:
+            lines.append(f"{_rows(len(self.root_fallbacks))} only found at the root of the folder, not at their listed path.")
+        for label, rows in (("missing from SharePoint", self.missing), ("writing to a local path already used by an earlier row", self.duplicate_paths)):
+            if rows:
+                examples = ", ".join(f"'{row.relative_file_path}'" for row in rows[:REPORT_EXAMPLES])
+                more = f" and {len(rows) - REPORT_EXAMPLES} more" if len(rows) > REPORT_EXAMPLES else ""
+                lines.append(f"{_rows(len(rows))} {label}: {examples}{more}.")
+        groups = group_by_source(self.rows, self)
+        shared = [(row, others) for row, others in groups if others and row in self.resolved]
+        if shared:
+            shared_rows = sum(len(others) for _, others in shared)
+            shared_bytes = sum(self.size_of(row) * len(others) for row, others in shared)
+            lines.append(f"{_rows(shared_rows)} {'fetches' if shared_rows == 1 else 'fetch'} the same file as an earlier row. Each file is downloaded once and copied to the other paths, saving {format_bytes(shared_bytes)}.")
+        sources = [row for row, _ in groups if row in self.resolved]
+        sizes = [self.size_of(row) for row in order_by_size(sources, self.size_of, order)]
+        projected = history.projected_seconds("download", sizes, workers)
+        if projected is None:
+            lines.append("No download has been timed yet, so there is no duration estimate. One will be available after the next completed download.")
+        else:
+            lines.append(f"Projected duration at the throughput measured on the last download: about {format_duration(projected)} ({workers} at a time).")
+        return lines
@@ -0,0 +1,63 @@
+import os
+import json
+
+# Partial transfers are written to '<name>.dth-part' next to a small '<name>.dth-part.json'
+# sidecar, and only renamed to '<name>' once every byte has arrived. The suffixes are
+# specific to this app so a user's own '.part' files are still treated as data.
+PART_SUFFIX = ".dth-part"
+SIDECAR_SUFFIX = ".dth-part.json"
+
+def part_path(path):
+    return path + PART_SUFFIX
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+def is_partial_artifact(file_name):
+    """
+    True for this app's temporary partial files and sidecars (including a sidecar
+    being replaced), which must never be treated as finished data (e.g. picked up
+    by an upload).
+    """
+    return file_name.endswith((PART_SUFFIX, SIDECAR_SUFFIX, SIDECAR_SUFFIX + ".tmp"))
+
+def read_sidecar(path):
+    """
+    Returns the sidecar state recorded for a partial local file, or None if there
+    is no usable partial to resume from.
+    """
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    part = part_path(path)
+    if not os.path.exists(part) or os.path.getsize(part) != state.get("size"):
+        return None
+    return state
+
+def write_sidecar(path, state):
+    # Write-then-replace so an interruption never leaves a truncated sidecar behind.
+    temp_path = sidecar_path(path) + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_path, sidecar_path(path))
+
+def finalize_partial(path):
+    """Renames a completed '.dth-part' file into place and removes its sidecar."""
+    os.replace(part_path(path), path)
+    discard_sidecar(path)
+
+def discard_sidecar(path):
+    try:
+        os.remove(sidecar_path(path))
+    except FileNotFoundError:
+        pass
+
+def discard_partial(path):
+    """Removes a partial file and its sidecar so the next attempt starts from byte 0."""
+    for leftover in (part_path(path), sidecar_path(path)):
+        try:
+            os.remove(leftover)
+        except FileNotFoundError:
+            pass
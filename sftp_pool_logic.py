@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+import paramiko
+
+from trace_logic import tracer
+
+# Keepalive interval for pooled connections, so idle gaps between jobs don't drop them.
+SFTP_KEEPALIVE_SECONDS = 30
+# Idle channels unused for longer than this are probed before being handed out again.
+IDLE_PROBE_SECONDS = 60
+# Most SSH servers allow 10 sessions per connection (OpenSSH MaxSessions).
+MAX_CHANNELS_PER_CONNECTION = 8
+
+def load_private_key(key_path, passphrase=None):
+    """Loads and decrypts a private key file of any type paramiko supports."""
+    if hasattr(paramiko.PKey, "from_path"):
+        password = passphrase.encode("utf-8") if isinstance(passphrase, str) and passphrase else None
+        try:
+            return paramiko.PKey.from_path(key_path, password=password)
+        except TypeError:
+            if password is None:
+                raise
+            # A passphrase was typed for a key that isn't encrypted; paramiko's own loading ignores it.
+            return paramiko.PKey.from_path(key_path)
+    last_error = None
+    for key_class in (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key):
+        try:
+            return key_class.from_private_key_file(key_path, password=passphrase)
+        except paramiko.SSHException as e:
+            last_error = e
+    raise last_error
+
+class _Connection:
+    def __init__(self, client):
+        self.client = client
+        self.idle = []
+        self.in_use = 0
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return bool(transport and transport.is_active())
+
+    def close(self):
+        for sftp, _ in self.idle:
+            sftp.close()
+        self.idle = []
+        self.client.close()
+
+class SFTPConnectionPool:
+    """
+    Process-wide pool of SFTP connections, reused across upload jobs. Private keys
+    are decrypted once and kept in memory, connections send keepalives while idle,
+    and each connection hands out several SFTP channels so concurrent upload workers
+    share one key exchange. A channel whose connection has died is dropped and a new
+    connection is made the next time one is asked for.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.keys = {}
+        self.owners = {}
+
+    @staticmethod
+    def _server_key(settings):
+        return (settings["SFTP_HOSTNAME"], int(settings.get("SFTP_PORT", 22)), settings["SFTP_USERNAME"], settings["SFTP_PRIVATE_KEY_PATH"])
+
+    def _private_key(self, key_path, passphrase):
+        # Keyed on the file's modified time so a replaced key file is read again.
+        cache_key = (os.path.abspath(key_path), os.path.getmtime(key_path))
+        with self.lock:
+            key = self.keys.get(cache_key)
+        if key is None:
+            key = load_private_key(key_path, passphrase)
+            with self.lock:
+                self.keys[cache_key] = key
+        return key
+
+    def _connect(self, settings, passphrase):
+        with tracer.span("connect", "network", host=settings["SFTP_HOSTNAME"]):
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
+                hostname=settings["SFTP_HOSTNAME"],
+                port=int(settings.get("SFTP_PORT", 22)),
+                username=settings["SFTP_USERNAME"],
+                pkey=self._private_key(settings["SFTP_PRIVATE_KEY_PATH"], passphrase),
+                timeout=15
+            )
+            client.get_transport().set_keepalive(SFTP_KEEPALIVE_SECONDS)
+        return _Connection(client)
+
+    def _take_idle_channel(self, server_key):
+        """Returns an idle channel on a live connection (dropping dead ones), or None."""
+        with self.lock:
+            connections = self.connections.setdefault(server_key, [])
+            for connection in list(connections):
+                if not connection.is_active():
+                    connections.remove(connection)
+                    connection.close()
+                    continue
+                if connection.idle:
+                    sftp, released_at = connection.idle.pop()
+                    connection.in_use += 1
+                    self.owners[id(sftp)] = (server_key, connection)
+                    return sftp, released_at
+        return None
+
+    def acquire(self, settings, passphrase=None):
+        """Returns an SFTP channel to the server in settings; give it back with release()."""
+        server_key = self._server_key(settings)
+        while True:
+            taken = self._take_idle_channel(server_key)
+            if taken is None:
+                break
+            sftp, released_at = taken
+            if time.monotonic() - released_at < IDLE_PROBE_SECONDS:
+                return sftp
+            try:
+                sftp.normalize(".")
+                return sftp
+            except Exception:
+                self.release(sftp, discard=True)
+
+        with self.lock:
+            connection = next((c for c in self.connections[server_key]
+                               if c.is_active() and c.in_use + len(c.idle) < MAX_CHANNELS_PER_CONNECTION), None)
+            if connection is not None:
+                connection.in_use += 1
+        if connection is None:
+            connection = self._connect(settings, passphrase)
+            connection.in_use = 1
+            with self.lock:
+                self.connections[server_key].append(connection)
+        try:
+            sftp = connection.client.open_sftp()
+        except Exception:
+            with self.lock:
+                connection.in_use -= 1
+            raise
+        with self.lock:
+            self.owners[id(sftp)] = (server_key, connection)
+        return sftp
+
+    def release(self, sftp, discard=False):
+        """Returns a channel to the pool, or closes it if discard is set or its connection has died."""
+        with self.lock:
+            owner = self.owners.pop(id(sftp), None)
+            if owner is None:
+                return
+            server_key, connection = owner
+            connection.in_use -= 1
+            channel = sftp.get_channel()
+            if not discard and connection.is_active() and not (channel and channel.closed):
+                connection.idle.append((sftp, time.monotonic()))
+                return
+        sftp.close()
+
+    def has_key(self, key_path):
+        """Whether the key file has already been decrypted this session, so no passphrase is needed."""
+        try:
+            cache_key = (os.path.abspath(key_path), os.path.getmtime(key_path))
+        except OSError:
+            return False
+        with self.lock:
+            return cache_key in self.keys
+
+    def unlocked_keys(self):
+        """The (path, modified time) of every key decrypted so far, for has_key() checks in another process."""
+        with self.lock:
+            return list(self.keys)
+
+    def close_all(self):
+        with self.lock:
+            connections = [c for server_connections in self.connections.values() for c in server_connections]
+            self.connections = {}
+            self.owners = {}
+        for connection in connections:
+            connection.close()
+
+sftp_pool = SFTPConnectionPool()
@@ -0,0 +1,114 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import cache_logic
+from cache_logic import ContentCache, clone_or_copy, open_cache_from_config
+
+class ContentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        self.clock = 1000.0
+        patcher = mock.patch.object(cache_logic.time, "time", lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def local_file(self, name, size):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(name.encode("utf-8")[:1] * size)
+        return path
+
+    def add(self, cache, name, size):
+        self.clock += 1
+        key = cache.make_key(f"/sites/a/{name}", "etag")
+        cache.add(key, self.local_file(name, size), f"/sites/a/{name}")
+        return key
+
+    def test_evicts_least_recently_used_above_max_bytes(self):
+        cache = ContentCache(self.cache_dir, 100)
+        a, b = self.add(cache, "a", 40), self.add(cache, "b", 40)
+        self.clock += 1
+        cache.materialise(a, os.path.join(self.temp_dir, "a copy"))
+        c = self.add(cache, "c", 40)
+        self.assertEqual(cache.lookup(a), 40)
+        self.assertIsNone(cache.lookup(b))
+        self.assertEqual(cache.lookup(c), 40)
+        self.assertFalse(os.path.exists(cache._blob_path(b)))
+
+    def test_file_larger_than_the_cache_is_not_added(self):
+        cache = ContentCache(self.cache_dir, 10)
+        self.assertIsNone(cache.lookup(self.add(cache, "big", 11)))
+
+    def test_blob_changed_on_disk_is_a_miss(self):
+        cache = ContentCache(self.cache_dir, 100)
+        key = self.add(cache, "a", 10)
+        with open(cache._blob_path(key), "ab") as f:
+            f.write(b"x")
+        self.assertIsNone(cache.lookup(key))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_index_survives_reopening(self):
+        cache = ContentCache(self.cache_dir, 100)
+        key = self.add(cache, "a", 10)
+        cache.close()
+        self.assertEqual(ContentCache(self.cache_dir, 100).lookup(key), 10)
+
+    def test_materialised_copy_is_independent_of_the_cache(self):
+        cache = ContentCache(self.cache_dir, 100)
+        key = self.add(cache, "a", 10)
+        target = os.path.join(self.temp_dir, "out", "a")
+        os.makedirs(os.path.dirname(target))
+        cache.materialise(key, target)
+        self.assertNotEqual(os.stat(target).st_ino, os.stat(cache._blob_path(key)).st_ino)
+        with open(target, "ab") as f:
+            f.write(b"edited")
+        self.assertEqual(cache.lookup(key), 10)
+
+    def test_add_later_reports_errors(self):
+        cache = ContentCache(self.cache_dir, 100)
+        failed = threading.Event()
+        errors = []
+        def on_error(e):
+            errors.append(e)
+            failed.set()
+        cache.add_later("key", os.path.join(self.temp_dir, "missing"), "/sites/a/missing", on_error)
+        self.assertTrue(failed.wait(5))
+        cache.close()
+        self.assertIsInstance(errors[0], FileNotFoundError)
+
+class CloneOrCopyTest(unittest.TestCase):
+    def test_replaces_the_target_without_sharing_it(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        src, dst = os.path.join(temp_dir, "src"), os.path.join(temp_dir, "dst")
+        for path, data in ((src, b"new"), (dst, b"old contents")):
+            with open(path, "wb") as f:
+                f.write(data)
+        self.assertIn(clone_or_copy(src, dst), ("reflink", "copy"))
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+        self.assertEqual(sorted(os.listdir(temp_dir)), ["dst", "src"])
+
+class OpenCacheFromConfigTest(unittest.TestCase):
+    def test_cache_settings(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        messages = queue.Queue()
+        self.assertIsNone(open_cache_from_config({"CACHE_FOLDER_PATH": " "}, messages))
+        cache = open_cache_from_config({"CACHE_FOLDER_PATH": temp_dir, "CACHE_MAX_GB": "lots"}, messages)
+        self.assertEqual(cache.max_bytes, cache_logic.DEFAULT_CACHE_MAX_GB * 1024 ** 3)
+        self.assertEqual(messages.get_nowait()[0], "file_info")
+        cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
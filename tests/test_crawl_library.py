@@ -0,0 +1,130 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from index_logic import FolderIndex
+
+try:
+    import discovery_logic
+except ImportError:
+    # discovery_logic needs the office365 client from requirements.txt.
+    discovery_logic = None
+
+LIBRARY_URL = "/sites/x/Shared Documents"
+
+class _FakeFolder:
+    def __init__(self, properties):
+        self.properties = properties
+
+class _FakeFolderCollection(list):
+    pass
+
+class _FakeContext:
+    """Serves folder listings from FakeLibrary.folders; counts how often each folder is listed."""
+    def __init__(self, library):
+        self.library = library
+        self.web = self
+
+    def with_credentials(self, credentials):
+        return self
+
+    @property
+    def properties(self):
+        return {"ServerRelativeUrl": "/sites/x"}
+
+    def get_folder_by_server_relative_url(self, url):
+        outer = self
+        class _Folder:
+            @property
+            def folders(self):
+                outer.library.listed.append(url)
+                return _FakeFolderCollection(outer.library.sub_folders(url))
+        return _Folder()
+
+    def load(self, obj, properties=None):
+        pass
+
+    def execute_query(self):
+        pass
+
+class FakeLibrary:
+    def __init__(self, paths):
+        self.folders = {}
+        self.listed = []
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        url = f"{LIBRARY_URL}/{path}"
+        self.folders[url] = 1
+        parent = url.rsplit('/', 1)[0]
+        if parent in self.folders:
+            # Adding a sub-folder changes its parent's item count and modified time, nothing above.
+            self.folders[parent] += 1
+
+    def sub_folders(self, parent_url):
+        children = []
+        for url, version in self.folders.items():
+            if url.rsplit('/', 1)[0] == parent_url:
+                item_count = sum(1 for other in self.folders if other.rsplit('/', 1)[0] == url)
+                children.append(_FakeFolder({"Name": url.rsplit('/', 1)[1], "ServerRelativeUrl": url,
+                                             "ItemCount": item_count, "TimeLastModified": f"v{version}"}))
+        return children
+
+@unittest.skipIf(discovery_logic is None, "office365 is not installed")
+class CrawlLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "index.sqlite")
+        self.config_path = os.path.join(self.temp_dir, "config.json")
+        with open(self.config_path, "w") as f:
+            f.write('{"APP_USERNAME": "u", "APP_PASSWORD": "p"}')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def crawl(self, library, stop_event=None):
+        messages = queue.Queue()
+        with mock.patch.object(discovery_logic, "ClientContext", lambda url: _FakeContext(library)), \
+             mock.patch.object(discovery_logic, "UserCredential", lambda user, password: None):
+            discovery_logic.crawl_library("https://x", self.index_path, messages, self.config_path, stop_event or threading.Event())
+        index = FolderIndex(self.index_path)
+        try:
+            return sorted(row[1] for row in index.search(""))
+        finally:
+            index.close()
+
+    def test_refresh_finds_folder_added_below_unchanged_folders(self):
+        library = FakeLibrary(["A", "A/B", "A/B/C"])
+        self.assertEqual(self.crawl(library), ["A", "A/B", "A/B/C"])
+        library.add("A/B/C/D")
+        self.assertEqual(self.crawl(library), ["A", "A/B", "A/B/C", "A/B/C/D"])
+
+    def test_refresh_lists_folders_an_interrupted_crawl_never_reached(self):
+        library = FakeLibrary(["A", "A/B", "A/B/C", "A/B/C/D"])
+        index = FolderIndex(self.index_path)
+        # As left by a crawl stopped after listing the library root and A.
+        index.update_children(LIBRARY_URL, LIBRARY_URL, [(f.properties["Name"], f.properties["ServerRelativeUrl"],
+                                                          f.properties["ItemCount"], f.properties["TimeLastModified"])
+                                                         for f in library.sub_folders(LIBRARY_URL)])
+        index.mark_listed(LIBRARY_URL)
+        index.update_children(f"{LIBRARY_URL}/A", LIBRARY_URL, [(f.properties["Name"], f.properties["ServerRelativeUrl"],
+                                                                 f.properties["ItemCount"], f.properties["TimeLastModified"])
+                                                                for f in library.sub_folders(f"{LIBRARY_URL}/A")])
+        index.mark_listed(f"{LIBRARY_URL}/A")
+        index.close()
+        self.assertEqual(self.crawl(library), ["A", "A/B", "A/B/C", "A/B/C/D"])
+
+    def test_stop_prevents_further_listing(self):
+        library = FakeLibrary(["A", "A/B", "A/B/C"])
+        stop_event = threading.Event()
+        stop_event.set()
+        self.crawl(library, stop_event)
+        self.assertEqual(library.listed, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from delta_logic import DeltaState, LocalChangeSource, plan_delta
+
+FOLDER_URL = "/sites/x/Shared Documents/D1 folder"
+
+class PlanDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def source(self, feed):
+        feed_path = os.path.join(self.temp_dir, "feed.json")
+        with open(feed_path, "w", encoding="utf-8") as f:
+            json.dump(feed, f)
+        return LocalChangeSource(feed_path)
+
+    def test_first_run_needs_a_full_sync(self):
+        source = self.source({"current_token": "1", "changes": []})
+        plan, reason = plan_delta(source, None, FOLDER_URL)
+        self.assertIsNone(plan)
+        self.assertIn("no previous sync", reason)
+
+    def test_changed_files_since_the_token(self):
+        source = self.source({"current_token": "3", "changes": [
+            {"token": "1", "type": "changed", "url": f"{FOLDER_URL}/old.pdf"},
+            {"token": "2", "type": "changed", "url": f"{FOLDER_URL}/Sub/A.pdf"},
+            {"token": "3", "type": "changed", "url": "/sites/x/Shared Documents/other/b.pdf"},
+        ]})
+        plan, reason = plan_delta(source, "1", FOLDER_URL)
+        self.assertIsNone(reason)
+        self.assertTrue(plan.is_changed(f"{FOLDER_URL}/sub/a.pdf"))
+        self.assertFalse(plan.is_changed(f"{FOLDER_URL}/old.pdf"))
+        self.assertFalse(plan.is_changed("/sites/x/Shared Documents/other/b.pdf"))
+
+    def test_removed_files_and_the_last_change_wins(self):
+        source = self.source({"current_token": "4", "changes": [
+            {"token": "2", "type": "changed", "url": f"{FOLDER_URL}/a.pdf"},
+            {"token": "3", "type": "removed", "url": f"{FOLDER_URL}/a.pdf"},
+            {"token": "3", "type": "removed", "url": f"{FOLDER_URL}/b.pdf"},
+            {"token": "4", "type": "changed", "url": f"{FOLDER_URL}/b.pdf"},
+        ]})
+        plan, _ = plan_delta(source, "1", FOLDER_URL)
+        self.assertTrue(plan.is_removed(f"{FOLDER_URL}/a.pdf"))
+        self.assertFalse(plan.is_changed(f"{FOLDER_URL}/a.pdf"))
+        self.assertTrue(plan.is_changed(f"{FOLDER_URL}/b.pdf"))
+        self.assertFalse(plan.is_removed(f"{FOLDER_URL}/b.pdf"))
+
+    def test_expired_token_needs_a_full_sync(self):
+        source = self.source({"current_token": "9", "oldest_token": "5", "changes": []})
+        plan, reason = plan_delta(source, "2", FOLDER_URL)
+        self.assertIsNone(plan)
+        self.assertIn("could not be read", reason)
+
+    def test_change_without_a_path_needs_a_full_sync(self):
+        source = self.source({"current_token": "2", "changes": [{"token": "2", "type": "changed"}]})
+        plan, reason = plan_delta(source, "1", FOLDER_URL)
+        self.assertIsNone(plan)
+        self.assertIn("file path", reason)
+
+    def test_tokens_are_stored_per_folder_pair(self):
+        state_path = os.path.join(self.temp_dir, "delta_state.json")
+        DeltaState(state_path).set_token(FOLDER_URL, self.temp_dir, "7")
+        state = DeltaState(state_path)
+        self.assertEqual(state.get_token(FOLDER_URL.upper(), self.temp_dir), "7")
+        self.assertIsNone(state.get_token(FOLDER_URL, os.path.join(self.temp_dir, "other")))
+
+if __name__ == "__main__":
+    unittest.main()
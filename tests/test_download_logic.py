@@ -0,0 +1,122 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import resume_logic
+from write_logic import LocalWriter
+
+try:
+    import download_logic
+except ImportError:
+    # download_logic needs the office365 client and pandas from requirements.txt
+    download_logic = None
+
+class FakeResponse:
+    def __init__(self, status_code, data, headers):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeContext:
+    """Serves one file's '$value' endpoint, honouring Range headers, and records the ranges asked for."""
+    service_root_url = "https://contoso.sharepoint.com/sites/team/_api"
+
+    def __init__(self, data, version='"{1,1}"', honour_ranges=True):
+        self.data = data
+        self.version = version
+        self.honour_ranges = honour_ranges
+        self.ranges = []
+
+    def pending_request(self):
+        return self
+
+    def execute_request_direct(self, request):
+        requested = request.headers.get("Range")
+        self.ranges.append(requested)
+        if not requested or not self.honour_ranges:
+            return FakeResponse(200, self.data, {"Content-Length": str(len(self.data)), "ETag": self.version})
+        start, end = (int(value) for value in re.match(r"bytes=(\d+)-(\d+)", requested).groups())
+        end = min(end, len(self.data) - 1)
+        return FakeResponse(206, self.data[start:end + 1], {"Content-Range": f"bytes {start}-{end}/{len(self.data)}", "ETag": self.version})
+
+@unittest.skipIf(download_logic is None, "office365 or pandas is not installed")
+class RangeDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.local_path = os.path.join(self.temp_dir, "big.bin")
+        self.data = bytes(range(256)) * 2 + b"tail"
+        for name, value in (("RANGE_PART_SIZE", 100), ("RANGE_DOWNLOAD_THRESHOLD", 250), ("STREAM_CHUNK_SIZE", 7)):
+            patcher = mock.patch.object(download_logic, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def download(self, ctx):
+        writer = LocalWriter()
+        try:
+            return download_logic.download_sharepoint_file(ctx, "/sites/team/Shared Documents/big.bin", self.local_path, writer).result(5)
+        finally:
+            writer.shutdown()
+
+    def read_local(self):
+        with open(self.local_path, "rb") as f:
+            return f.read()
+
+    def test_plan_ranges(self):
+        self.assertEqual(download_logic._plan_ranges(1), [(0, 0)])
+        self.assertEqual(download_logic._plan_ranges(100), [(0, 99)])
+        self.assertEqual(download_logic._plan_ranges(250), [(0, 99), (100, 249)])
+        self.assertEqual(download_logic._plan_ranges(301), [(0, 99), (100, 199), (200, 299), (300, 300)])
+
+    def test_downloads_in_ranges_and_renames_into_place(self):
+        ctx = FakeContext(self.data)
+        self.assertEqual(self.download(ctx), len(self.data))
+        self.assertEqual(self.read_local(), self.data)
+        self.assertEqual(sorted(ctx.ranges), ["bytes=0-99", "bytes=100-199", "bytes=200-299", "bytes=300-399", "bytes=400-499", "bytes=500-515"])
+        self.assertEqual(os.listdir(self.temp_dir), ["big.bin"])
+
+    def test_resumes_only_the_ranges_the_sidecar_does_not_record(self):
+        part = bytearray(len(self.data))
+        part[0:100] = self.data[0:100]
+        part[300:400] = self.data[300:400]
+        with open(resume_logic.part_path(self.local_path), "wb") as f:
+            f.write(part)
+        resume_logic.write_sidecar(self.local_path, {"size": len(self.data), "version": '"{1,1}"', "completed": [0, 300]})
+        ctx = FakeContext(self.data)
+        self.assertEqual(self.download(ctx), len(self.data))
+        self.assertEqual(sorted(ctx.ranges), ["bytes=100-199", "bytes=200-299", "bytes=400-499", "bytes=500-515"])
+        self.assertEqual(self.read_local(), self.data)
+
+    def test_changed_file_restarts_from_the_beginning(self):
+        with open(resume_logic.part_path(self.local_path), "wb") as f:
+            f.write(b"\0" * len(self.data))
+        resume_logic.write_sidecar(self.local_path, {"size": len(self.data), "version": '"{1,1}"', "completed": [0]})
+        ctx = FakeContext(self.data, version='"{1,2}"')
+        self.assertEqual(self.download(ctx), len(self.data))
+        self.assertEqual(ctx.ranges.count("bytes=0-99"), 1)
+        self.assertEqual(self.read_local(), self.data)
+
+    def test_server_ignoring_ranges_streams_the_whole_file(self):
+        ctx = FakeContext(self.data, honour_ranges=False)
+        self.assertEqual(self.download(ctx), len(self.data))
+        self.assertEqual(ctx.ranges, ["bytes=0-99"])
+        self.assertEqual(self.read_local(), self.data)
+        self.assertEqual(os.listdir(self.temp_dir), ["big.bin"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import plan_logic
+from plan_logic import (build_upload_plan, fit_file_cost, file_cost, format_count, int_from_config,
+                        order_by_size, projected_makespan, transfer_order_from_config)
+
+class BuildUploadPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.join(tempfile.mkdtemp(), "D1")
+        for path, data in (("a.txt", b"aaa"), ("sub/b.txt", b"bb"), ("sub/deeper/c.txt", b"c"),
+                           ("notes.part", b"user data"), ("sub/b.txt.dth-part", b"partial"), ("sub/b.txt.dth-part.json", b"{}")):
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.root))
+
+    def test_lists_files_and_directories_parents_first(self):
+        plan = build_upload_plan(self.root)
+        self.assertEqual([entry.remote_path for entry in plan.entries],
+                         ["D1/a.txt", "D1/notes.part", "D1/sub/b.txt", "D1/sub/deeper/c.txt"])
+        self.assertEqual(plan.directories, ["D1/sub", "D1/sub/deeper"])
+        self.assertEqual(plan.total_bytes, 3 + 9 + 2 + 1)
+        self.assertEqual(plan.unreadable, [])
+
+    def test_unreadable_sub_folder_is_skipped_and_recorded(self):
+        real_scandir = os.scandir
+        def scandir(path):
+            if os.path.basename(path) == "sub":
+                raise PermissionError(13, "Permission denied", path)
+            return real_scandir(path)
+        with mock.patch.object(plan_logic.os, "scandir", scandir):
+            plan = build_upload_plan(self.root, "remote")
+        self.assertEqual([entry.remote_path for entry in plan.entries], ["remote/a.txt", "remote/notes.part"])
+        self.assertEqual([path for path, _ in plan.unreadable], [os.path.join(self.root, "sub")])
+
+    def test_unreadable_source_folder_raises(self):
+        with self.assertRaises(OSError):
+            build_upload_plan(os.path.join(self.root, "missing"))
+
+class ScheduleTest(unittest.TestCase):
+    def test_largest_first_keeps_unknown_sizes_last_in_listed_order(self):
+        sizes = {"a": 10, "b": None, "c": 30, "d": None, "e": 20}
+        self.assertEqual(order_by_size(list(sizes), sizes.get, "largest_first"), ["c", "e", "a", "b", "d"])
+        self.assertEqual(order_by_size(list(sizes), sizes.get, "as_listed"), list(sizes))
+
+    def test_projected_makespan_hands_files_to_the_first_free_worker(self):
+        seconds = lambda size: size
+        self.assertEqual(projected_makespan([1, 1, 1, 10], 2, seconds), 11)
+        self.assertEqual(projected_makespan([10, 1, 1, 1], 2, seconds), 10)
+        self.assertEqual(projected_makespan([3, 4], 8, seconds), 4)
+        self.assertEqual(projected_makespan([], 2, seconds), 0)
+
+    def test_fit_file_cost_separates_overhead_from_throughput(self):
+        overhead, per_byte, mean_size = fit_file_cost([(0, 0.5), (100, 1.5), (200, 2.5), (None, 99)])
+        self.assertAlmostEqual(overhead, 0.5)
+        self.assertAlmostEqual(per_byte, 0.01)
+        self.assertEqual(mean_size, 100)
+        self.assertAlmostEqual(file_cost(overhead, per_byte, mean_size)(None), 1.5)
+
+    def test_fit_file_cost_with_one_size_or_no_samples(self):
+        self.assertEqual(fit_file_cost([(100, 2.0), (100, 4.0)]), (0, 0.03, 100))
+        self.assertIsNone(fit_file_cost([(None, 1.0)]))
+
+class ConfigValueTest(unittest.TestCase):
+    def test_invalid_values_fall_back_to_the_default_with_a_warning(self):
+        messages = queue.Queue()
+        self.assertEqual(transfer_order_from_config({"TRANSFER_ORDER": "random"}, messages), "largest_first")
+        self.assertEqual(int_from_config({"UPLOAD_WORKERS": "0"}, "UPLOAD_WORKERS", 4, messages, minimum=1), 4)
+        self.assertEqual(int_from_config({"UPLOAD_WORKERS": "many"}, "UPLOAD_WORKERS", 4, messages), 4)
+        self.assertEqual(messages.qsize(), 3)
+
+    def test_valid_and_missing_values(self):
+        messages = queue.Queue()
+        self.assertEqual(transfer_order_from_config({"TRANSFER_ORDER": " As_Listed "}, messages), "as_listed")
+        self.assertEqual(transfer_order_from_config({}, messages), "largest_first")
+        self.assertEqual(int_from_config({"UPLOAD_WORKERS": "8"}, "UPLOAD_WORKERS", 4, messages), 8)
+        self.assertEqual(int_from_config({"UPLOAD_WORKERS": ""}, "UPLOAD_WORKERS", 4, messages), 4)
+        self.assertTrue(messages.empty())
+
+    def test_format_count(self):
+        self.assertEqual(format_count(1, "row"), "1 row")
+        self.assertEqual(format_count(0, "row"), "0 rows")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from plan_logic import ManifestRow
+from preflight_logic import Preflight, ThroughputHistory, group_by_source
+
+SITE = "/sites/team/Shared Documents/D1"
+
+def row(relative_path, local_name=None):
+    file_name = relative_path.split("/")[-1]
+    return ManifestRow(relative_path, os.path.join("out", local_name or relative_path), f"{SITE}/{relative_path}", f"{SITE}/{file_name}")
+
+class PreflightTest(unittest.TestCase):
+    def setUp(self):
+        self.listing = {f"{SITE}/a/one.txt".lower(): (100, "etag-1"), f"{SITE}/two.txt".lower(): (200, "etag-2")}
+
+    def test_resolves_rows_to_their_path_or_the_folder_root(self):
+        one, two, three = row("a/one.txt"), row("b/two.txt"), row("c/three.txt")
+        preflight = Preflight([one, two, three], self.listing)
+        self.assertEqual(preflight.resolve(one), (one.primary_url, 100, "etag-1"))
+        self.assertEqual(preflight.resolve(two), (two.root_url, 200, "etag-2"))
+        self.assertIsNone(preflight.resolve(three))
+        self.assertEqual(preflight.root_fallbacks, [two])
+        self.assertEqual(preflight.missing, [three])
+        self.assertEqual(preflight.total_bytes, 300)
+
+    def test_notes_rows_writing_to_the_same_local_path(self):
+        first, second = row("a/one.txt", "x.txt"), row("b/two.txt", "x.txt")
+        self.assertEqual(Preflight([first, second], self.listing).duplicate_paths, [second])
+
+    def test_report_without_history(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        history = ThroughputHistory(os.path.join(temp_dir, "history.json"))
+        rows = [row("a/one.txt"), row("A/One.txt", "copy.txt"), row("c/three.txt")]
+        lines = Preflight(rows, self.listing).report(history, 4, "largest_first")
+        self.assertTrue(lines[0].startswith("Preflight: 2 of 3 manifest rows found"))
+        self.assertIn("1 row missing from SharePoint: 'c/three.txt'.", lines)
+        self.assertTrue(any(line.startswith("1 row fetches the same file as an earlier row.") for line in lines))
+        self.assertTrue(lines[-1].startswith("No download has been timed yet"))
+
+class GroupBySourceTest(unittest.TestCase):
+    def test_rows_fetching_one_file_are_grouped_in_manifest_order(self):
+        listing = {f"{SITE}/two.txt".lower(): (200, "etag-2")}
+        first, same_path, via_root, other = row("two.txt"), row("TWO.txt", "2.txt"), row("b/two.txt"), row("c/three.txt")
+        groups = group_by_source([first, other, same_path, via_root], Preflight([first, other, same_path, via_root], listing))
+        self.assertEqual(groups, [(first, [same_path, via_root]), (other, [])])
+
+    def test_without_preflight_rows_are_matched_on_their_own_url(self):
+        first, same_path, via_root = row("two.txt"), row("Two.txt", "2.txt"), row("b/two.txt")
+        self.assertEqual(group_by_source([first, same_path, via_root]), [(first, [same_path]), (via_root, [])])
+
+class ThroughputHistoryTest(unittest.TestCase):
+    def test_projection_uses_the_recorded_fit(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, "history.json")
+        ThroughputHistory(path).record("download", (1.0, 0.01, 100), 2)
+        history = ThroughputHistory(path)
+        self.assertAlmostEqual(history.projected_seconds("download", [100, 100, 100], 2), 4.0)
+        self.assertIsNone(history.projected_seconds("upload", [100], 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import resume_logic
+
+class ResumeLogicTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "report.pdf")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_part(self, data):
+        with open(resume_logic.part_path(self.path), "wb") as f:
+            f.write(data)
+
+    def test_only_this_apps_artifacts_are_partial(self):
+        for name in ("a.pdf.dth-part", "a.pdf.dth-part.json", "a.pdf.dth-part.json.tmp"):
+            self.assertTrue(resume_logic.is_partial_artifact(name), name)
+        for name in ("a.pdf", "video.part", "notes.part.json", "a.dth-part.pdf"):
+            self.assertFalse(resume_logic.is_partial_artifact(name), name)
+
+    def test_sidecar_round_trip(self):
+        self.write_part(b"12345")
+        state = {"size": 5, "total_size": 10, "version": "etag-1"}
+        resume_logic.write_sidecar(self.path, state)
+        self.assertEqual(resume_logic.read_sidecar(self.path), state)
+        self.assertFalse(os.path.exists(resume_logic.sidecar_path(self.path) + ".tmp"))
+
+    def test_sidecar_is_unusable_without_a_matching_part(self):
+        resume_logic.write_sidecar(self.path, {"size": 5})
+        self.assertIsNone(resume_logic.read_sidecar(self.path))
+        self.write_part(b"1234")
+        self.assertIsNone(resume_logic.read_sidecar(self.path))
+        with open(resume_logic.sidecar_path(self.path), "w", encoding="utf-8") as f:
+            f.write("{truncated")
+        self.assertIsNone(resume_logic.read_sidecar(self.path))
+
+    def test_finalize_and_discard(self):
+        self.write_part(b"done")
+        resume_logic.write_sidecar(self.path, {"size": 4})
+        resume_logic.finalize_partial(self.path)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"done")
+        self.assertEqual(os.listdir(self.temp_dir), ["report.pdf"])
+
+        self.write_part(b"again")
+        resume_logic.write_sidecar(self.path, {"size": 5})
+        resume_logic.discard_partial(self.path)
+        resume_logic.discard_partial(self.path)
+        self.assertEqual(os.listdir(self.temp_dir), ["report.pdf"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+import throttle_logic
+from throttle_logic import TokenBucket, mbps_to_bytes
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(throttle_logic.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_rate_never_waits(self):
+        bucket = TokenBucket()
+        self.assertEqual(bucket.reserve(10 ** 12), 0)
+
+    def test_one_second_of_burst_then_waits_off_the_debt(self):
+        bucket = TokenBucket(100)
+        self.assertEqual(bucket.reserve(100), 0)
+        self.assertAlmostEqual(bucket.reserve(50), 0.5)
+        self.assertAlmostEqual(bucket.reserve(50), 1.0)
+
+    def test_refills_over_time_up_to_one_second(self):
+        bucket = TokenBucket(100)
+        bucket.reserve(100)
+        self.clock.now += 0.5
+        self.assertEqual(bucket.reserve(50), 0)
+        self.clock.now += 60
+        self.assertEqual(bucket.reserve(100), 0)
+        self.assertAlmostEqual(bucket.reserve(1), 0.01)
+
+    def test_lowering_the_rate_caps_saved_tokens(self):
+        bucket = TokenBucket(1000)
+        bucket.set_rate(10)
+        self.assertEqual(bucket.reserve(10), 0)
+        self.assertAlmostEqual(bucket.reserve(10), 1.0)
+        bucket.set_rate(None)
+        self.assertEqual(bucket.reserve(10 ** 6), 0)
+
+class MbpsTest(unittest.TestCase):
+    def test_mbps_to_bytes(self):
+        self.assertEqual(mbps_to_bytes(8), 1000 * 1000)
+        self.assertEqual(mbps_to_bytes("0.8"), 100 * 1000)
+        for unlimited in (None, "", 0, "0", -5, "fast"):
+            self.assertIsNone(mbps_to_bytes(unlimited))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from write_logic import LocalWriter
+
+class LocalWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_writes_land_before_the_file_is_closed(self):
+        writer = LocalWriter()
+        path = os.path.join(self.temp_dir, "new", "folder", "a.bin")
+        writer.open(path, size=6)
+        writer.write(path, 3, b"def")
+        writer.write(path, 0, b"abc")
+        future = writer.submit(self.read, path, file_path=path, close=True)
+        self.assertEqual(future.result(5), b"abcdef")
+        writer.shutdown()
+
+    def test_calls_run_in_submit_order(self):
+        writer = LocalWriter()
+        calls = []
+        futures = [writer.submit(calls.append, n) for n in range(20)]
+        self.assertEqual([future.result(5) for future in futures], [None] * 20)
+        writer.shutdown()
+        self.assertEqual(calls, list(range(20)))
+
+    def test_deferred_finishing_steps_run_in_order_after_the_data_is_written(self):
+        writer = LocalWriter(fsync_batch_size=3)
+        seen = []
+        futures = []
+        for n in range(5):
+            path = os.path.join(self.temp_dir, f"{n}.bin")
+            writer.open(path, size=2)
+            writer.write(path, 0, b"%02d" % n)
+            futures.append(writer.submit(lambda n=n, path=path: seen.append((n, self.read(path))), file_path=path, close=True))
+        writer.shutdown()
+        for future in futures:
+            self.assertIsNone(future.result(0))
+        self.assertEqual(seen, [(n, b"%02d" % n) for n in range(5)])
+
+    def test_write_error_is_raised_through_the_closing_future(self):
+        writer = LocalWriter()
+        path = os.path.join(self.temp_dir, "a folder")
+        os.mkdir(path)
+        writer.open(path)
+        writer.write(path, 0, b"data")
+        future = writer.submit(lambda: "renamed", file_path=path, close=True)
+        with self.assertRaises(OSError):
+            future.result(5)
+        writer.shutdown()
+
+    def test_submit_after_shutdown_raises(self):
+        writer = LocalWriter()
+        writer.shutdown()
+        with self.assertRaises(RuntimeError):
+            writer.submit(print)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import time
+import threading
+from datetime import datetime
+
+DIRECTIONS = ("download", "upload")
+# How often the time-of-day schedule is re-checked while transfers are running.
+SCHEDULE_CHECK_SECONDS = 30
+
+def mbps_to_bytes(value):
+    """Converts a megabits-per-second setting to bytes per second. Empty or 0 means unlimited."""
+    try:
+        mbps = float(value or 0)
+    except (TypeError, ValueError):
+        return None
+    return int(mbps * 1000 * 1000 / 8) if mbps > 0 else None
+
+class TokenBucket:
+    """
+    Limits throughput to a rate in bytes per second, with up to one second of burst.
+    A large request may take the bucket into debt; the caller then waits it off.
+    """
+    def __init__(self, rate=None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = rate or 0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            if rate:
+                self.tokens = min(self.tokens, rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, num_bytes):
+        """Takes num_bytes from the bucket and returns how long the caller must wait."""
+        with self.lock:
+            if not self.rate:
+                return 0
+            self._refill()
+            self.tokens -= num_bytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+class BandwidthLimiter:
+    """
+    Process-wide bandwidth shaping shared by every download and upload worker: one
+    bucket per direction plus a global bucket across both. Limits come from the
+    configuration, optionally replaced during time-of-day windows from
+    BANDWIDTH_SCHEDULE, and can be overridden live from the GUI.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {name: TokenBucket() for name in DIRECTIONS + ("total",)}
+        self.base_limits = {}
+        self.schedule = []
+        self.override = None
+        self.next_schedule_check = 0
+
+    def configure_from_config(self, config, queue=None):
+        """
+        Loads the caps and schedule. Invalid caps are reported to queue as file_info and
+        treated as unlimited; invalid schedule windows are reported and skipped.
+        """
+        def warn(message):
+            if queue is not None:
+                queue.put(("file_info", message))
+        for name in self.buckets:
+            value = config.get(f"{name.upper()}_LIMIT_MBPS")
+            if not _is_mbps(value):
+                warn(f"{name.upper()}_LIMIT_MBPS must be a number, not '{value}'. Using no limit.")
+        schedule = config.get("BANDWIDTH_SCHEDULE") or []
+        if not isinstance(schedule, list):
+            warn("BANDWIDTH_SCHEDULE must be a list of time windows. Ignoring it.")
+            schedule = []
+        valid_windows = []
+        for window in schedule:
+            problem = _window_problem(window)
+            if problem:
+                warn(f"Ignoring BANDWIDTH_SCHEDULE window {window}: {problem}.")
+            else:
+                valid_windows.append(window)
+        with self.lock:
+            self.base_limits = {name: mbps_to_bytes(config.get(f"{name.upper()}_LIMIT_MBPS")) for name in self.buckets}
+            self.schedule = valid_windows
+            self.next_schedule_check = 0
+        self._apply_current_limits()
+
+    def set_override(self, limits):
+        """Sets live limits (bytes per second, None for unlimited) or, with None, returns to the configured ones."""
+        with self.lock:
+            self.override = dict(limits) if limits is not None else None
+            self.next_schedule_check = 0
+        self._apply_current_limits()
+
+    def current_limits(self):
+        with self.lock:
+            if self.override is not None:
+                return dict(self.override)
+            limits = dict(self.base_limits)
+            window = _active_window(self.schedule, datetime.now())
+        if window:
+            for name in self.buckets:
+                if f"{name}_limit_mbps" in window:
+                    limits[name] = mbps_to_bytes(window[f"{name}_limit_mbps"])
+        return limits
+
+    def _apply_current_limits(self):
+        limits = self.current_limits()
+        for name, bucket in self.buckets.items():
+            bucket.set_rate(limits.get(name))
+
+    def consume(self, direction, num_bytes, stop_event=None):
+        """
+        Blocks until num_bytes may be sent in the given direction. Returns early if
+        stop_event is set, so a throttled transfer can still be stopped promptly.
+        """
+        now = time.monotonic()
+        if now >= self.next_schedule_check:
+            self.next_schedule_check = now + SCHEDULE_CHECK_SECONDS
+            self._apply_current_limits()
+        wait = max(self.buckets[direction].reserve(num_bytes), self.buckets["total"].reserve(num_bytes))
+        deadline = time.monotonic() + wait
+        while wait > 0:
+            if stop_event is not None and stop_event.is_set():
+                return
+            time.sleep(min(wait, 0.25))
+            wait = deadline - time.monotonic()
+
+def _is_mbps(value):
+    try:
+        float(value or 0)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def _parse_time_of_day(value):
+    return datetime.strptime(value, "%H:%M").time()
+
+def _window_problem(window):
+    """Why a BANDWIDTH_SCHEDULE window can't be used, or None if it is fine."""
+    if not isinstance(window, dict):
+        return "it is not an object"
+    try:
+        _parse_time_of_day(window["start"])
+        _parse_time_of_day(window["end"])
+    except (KeyError, TypeError, ValueError):
+        return "it needs a 'start' and 'end' time like \"08:00\""
+    for name in DIRECTIONS + ("total",):
+        if not _is_mbps(window.get(f"{name}_limit_mbps")):
+            return f"{name}_limit_mbps must be a number"
+    return None
+
+def _active_window(schedule, now):
+    """
+    Returns the first schedule window covering the current time. Windows look like
+    {"start": "08:00", "end": "18:00", "download_limit_mbps": 20} and may wrap past midnight.
+    """
+    current = now.time()
+    for window in schedule:
+        try:
+            start, end = _parse_time_of_day(window["start"]), _parse_time_of_day(window["end"])
+        except (KeyError, ValueError):
+            continue
+        if start <= end:
+            if start <= current < end:
+                return window
+        elif current >= start or current < end:
+            return window
+    return None
+
+bandwidth_limiter = BandwidthLimiter()
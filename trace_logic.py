@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+from datetime import datetime
+
+def _enabled(value):
+    return str(value or "").strip().lower() in ("1", "true", "yes", "on")
+
+class _Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._record(self.name, self.category, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer:
+    """
+    Records timed spans for a transfer job and writes them out as Chrome trace JSON,
+    which opens in chrome://tracing and ui.perfetto.dev. Off unless a job starts it,
+    in which case span() costs next to nothing. The job can also be run under
+    cProfile: the thread that starts the trace, plus any work passed to profiled().
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = None
+        self.thread_names = {}
+        self.origin = 0
+        self.profiler = None
+        self.thread_profilers = {}
+
+    @property
+    def active(self):
+        return self.events is not None
+
+    def start_from_config(self, config):
+        """Starts tracing if TRACE_TRANSFERS is set, profiling too with TRACE_PROFILE. Returns whether it started."""
+        if not _enabled(config.get("TRACE_TRANSFERS")):
+            return False
+        with self.lock:
+            self.events = []
+            self.thread_names = {}
+            self.origin = time.perf_counter_ns()
+            self.thread_profilers = {}
+        if _enabled(config.get("TRACE_PROFILE")):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return True
+
+    def span(self, name, category="job", **args):
+        """A context manager timing the enclosed block. Extra keyword arguments are shown with the span."""
+        if self.events is None:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def profiled(self, function, *args, **kwargs):
+        """
+        Calls function(*args, **kwargs), under this thread's own profiler while
+        profiling is on, so work done in worker threads is in the .prof file too.
+        """
+        if self.profiler is None:
+            return function(*args, **kwargs)
+        thread_id = threading.get_ident()
+        with self.lock:
+            profiler = self.thread_profilers.setdefault(thread_id, cProfile.Profile())
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler, which already sees every thread.
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+    def _record(self, name, category, start_ns, duration_ns, args):
+        thread = threading.current_thread()
+        with self.lock:
+            if self.events is None:
+                return
+            self.thread_names[thread.ident] = thread.name
+            self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                                "ts": (start_ns - self.origin) / 1000, "dur": duration_ns / 1000, "args": args})
+
+    def finish(self, output_dir, job_name):
+        """
+        Stops tracing (and profiling) and writes trace_<job>_<time>.json, plus a
+        matching .prof file if profiling was on. Returns the paths written.
+        """
+        profiler, self.profiler = self.profiler, None
+        if profiler:
+            profiler.disable()
+        with self.lock:
+            events, self.events = self.events, None
+            thread_names = self.thread_names
+            thread_profilers, self.thread_profilers = list(self.thread_profilers.values()), {}
+        if events is None:
+            return []
+        pid = os.getpid()
+        metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in thread_names.items()]
+        stem = os.path.join(output_dir, f"trace_{job_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        with open(stem + ".json", 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        paths = [stem + ".json"]
+        if profiler:
+            stats = pstats.Stats(profiler)
+            for thread_profiler in thread_profilers:
+                if thread_profiler.getstats():
+                    stats.add(thread_profiler)
+            stats.dump_stats(stem + ".prof")
+            paths.append(stem + ".prof")
+        return paths
+
+tracer = Tracer()
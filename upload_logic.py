@@ -1,105 +1,481 @@
 import os
+import re
 import json
-import paramiko
+import queue as queue_module
+import time
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def perform_upload(local_source_path, queue, stop_event, passphrase, config_path, output_dir):
+import resume_logic
+from plan_logic import build_upload_plan, format_bytes, int_from_config, MakespanMeter, order_by_size, transfer_order_from_config
+from throttle_logic import bandwidth_limiter
+from trace_logic import tracer
+from sftp_pool_logic import sftp_pool
+from cancel_logic import CancelToken, TransferCancelled, closing_on_cancel
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Chunks read ahead for each fan-out target, and how long a target may go without
+# accepting one before it is dropped from the job so it cannot hold up the others.
+FANOUT_BUFFER_CHUNKS = 32
+TARGET_STALL_SECONDS = 120
+# Files uploaded at once, each over its own pooled SFTP channel. Set with UPLOAD_WORKERS.
+DEFAULT_UPLOAD_WORKERS = 4
+
+def _read_remote_sidecar(sftp, remote_file):
+    try:
+        with sftp.open(resume_logic.sidecar_path(remote_file), 'r') as f:
+            return json.loads(f.read())
+    except (IOError, ValueError):
+        return None
+
+def _open_remote_part(sftp, remote_file, expected):
     """
-    Connects to SFTP and uploads a directory, sending progress to the GUI queue.
+    Returns the offset to continue a remote '.dth-part' file from: its current size if
+    the remote sidecar shows it came from the same local file, otherwise 0 (after
+    writing a fresh sidecar).
     """
-    error_log_file = None
-    error_count = 0
-    client = None
-    sftp = None
+    offset = 0
+    with tracer.span("check remote partial", "network", path=remote_file):
+        if _read_remote_sidecar(sftp, remote_file) == expected:
+            try:
+                offset = sftp.stat(resume_logic.part_path(remote_file)).st_size
+            except IOError:
+                offset = 0
+            if offset > expected["size"]:
+                offset = 0
+        if offset == 0:
+            with sftp.open(resume_logic.sidecar_path(remote_file), 'w') as f:
+                f.write(json.dumps(expected))
+    return offset
+
+def _finish_remote_part(sftp, remote_file, expected):
+    """Checks the remote '.dth-part' file is complete and renames it into place."""
+    remote_part = resume_logic.part_path(remote_file)
+    with tracer.span("verify and rename", "network", path=remote_file):
+        remote_size = sftp.stat(remote_part).st_size
+        if remote_size != expected["size"]:
+            raise IOError(f"Remote partial is {remote_size} bytes, expected {expected['size']}.")
+        try:
+            sftp.posix_rename(remote_part, remote_file)
+        except IOError:
+            # Servers without the posix-rename extension refuse to overwrite on rename.
+            try:
+                sftp.remove(remote_file)
+            except IOError:
+                pass
+            sftp.rename(remote_part, remote_file)
+        sftp.remove(resume_logic.sidecar_path(remote_file))
+
+def _expected_remote_state(local_file, size, mtime):
+    if size is None or mtime is None:
+        local_stat = os.stat(local_file)
+        size, mtime = local_stat.st_size, local_stat.st_mtime
+    return {"size": size, "mtime": int(mtime)}
+
+def upload_file(sftp, local_file, remote_file, size=None, mtime=None, cancel=None):
+    """
+    Uploads a single file to '<name>.dth-part' on the server and renames it into place
+    once complete. If a previous attempt at the same local file (same size and
+    mtime, per the remote sidecar) was interrupted, it resumes by appending from
+    the remote partial's current size instead of starting again.
+    Size and mtime can be passed in from a transfer plan to avoid another stat.
+    With a CancelToken, Stop closes the channel mid-file and raises TransferCancelled;
+    the remote partial is kept for the next attempt to resume.
+    """
+    expected = _expected_remote_state(local_file, size, mtime)
+    offset = _open_remote_part(sftp, remote_file, expected)
+
+    with tracer.span("send", "network", path=remote_file, offset=offset, size=expected["size"]):
+        with closing_on_cancel(cancel, sftp), open(local_file, 'rb') as local_f, \
+                sftp.open(resume_logic.part_path(remote_file), 'r+b' if offset else 'wb') as remote_f:
+            remote_f.set_pipelined(True)
+            local_f.seek(offset)
+            remote_f.seek(offset)
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                chunk = local_f.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                bandwidth_limiter.consume("upload", len(chunk), cancel.stop_event if cancel is not None else None)
+                remote_f.write(chunk)
+
+    _finish_remote_part(sftp, remote_file, expected)
+
+class TargetStalledError(IOError):
+    pass
+
+class TargetUnreachableError(IOError):
+    pass
+
+class UploadTarget:
+    """
+    One SFTP destination of an upload job, with its own error log and counts.
+    Connections come from the shared pool. A target that stalls or cannot be
+    reconnected is marked failed and skipped for the rest of the job; the remote
+    partials it leaves are resumed next time.
+    """
+    def __init__(self, name, settings, error_log_file):
+        self.name = name
+        self.settings = settings
+        self.error_log_file = error_log_file
+        self.failed = None
+        self.files_done = 0
+        self.error_count = 0
+
+    def acquire(self, passphrase):
+        try:
+            return sftp_pool.acquire(self.settings, passphrase)
+        except Exception as e:
+            raise TargetUnreachableError(f"could not connect: {e}") from e
+
+    def log_error(self, error_message):
+        self.error_count += 1
+        with open(self.error_log_file, "a", encoding='utf-8') as f:
+            f.write(f"{datetime.now().isoformat()} - {error_message}\n")
+
+    def mark_failed(self, reason):
+        self.failed = reason
+
+def load_upload_targets(config, output_dir):
+    """
+    Returns the upload targets from SFTP_TARGETS, a list of objects with a NAME and any
+    SFTP_* keys that differ from the top-level settings. Without SFTP_TARGETS there is
+    one target built from the top-level settings, logging to upload_errors.txt as before.
+    """
+    target_configs = config.get("SFTP_TARGETS") or []
+    if not target_configs:
+        return [UploadTarget(config["SFTP_HOSTNAME"], config, os.path.join(output_dir, "upload_errors.txt"))]
+    targets = []
+    for number, target_config in enumerate(target_configs, start=1):
+        settings = dict(config)
+        settings.update(target_config)
+        name = str(target_config.get("NAME") or settings["SFTP_HOSTNAME"] or f"Target {number}")
+        safe_name = re.sub(r'[^A-Za-z0-9_-]+', '_', name)
+        targets.append(UploadTarget(name, settings, os.path.join(output_dir, f"upload_errors_{safe_name}.txt")))
+    return targets
+
+def keys_already_unlocked(config_path, has_key=None):
+    """
+    Whether every target's private key was decrypted earlier this session, so the passphrase
+    prompt can be skipped. has_key checks another pool's keys, e.g. the transfer process's.
+    """
+    has_key = has_key or sftp_pool.has_key
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        return all(has_key(target.settings["SFTP_PRIVATE_KEY_PATH"]) for target in load_upload_targets(config, ""))
+    except (OSError, ValueError, KeyError):
+        return False
+
+def _send_to_target(target, sftp, remote_file, expected, offset, chunks, abandoned, cancel):
+    """Worker for one fan-out target: writes the chunks it is given, then finishes the file."""
+    with tracer.span("send", "network", target=target.name, path=remote_file, offset=offset, size=expected["size"]):
+        with closing_on_cancel(cancel, sftp), sftp.open(resume_logic.part_path(remote_file), 'r+b' if offset else 'wb') as remote_f:
+            remote_f.set_pipelined(True)
+            remote_f.seek(offset)
+            while True:
+                try:
+                    item = chunks.get(timeout=0.5)
+                except queue_module.Empty:
+                    if abandoned.is_set():
+                        return
+                    continue
+                if item is None:
+                    break
+                if cancel is not None:
+                    cancel.check()
+                position, chunk = item
+                if position < offset:
+                    # This target's partial already holds the start of the chunk.
+                    chunk = chunk[offset - position:]
+                bandwidth_limiter.consume("upload", len(chunk), cancel.stop_event if cancel is not None else None)
+                remote_f.write(chunk)
+    _finish_remote_part(sftp, remote_file, expected)
+
+def fan_out_file(channels, local_file, remote_file, size=None, mtime=None, stall_timeout=TARGET_STALL_SECONDS, cancel=None):
+    """
+    Uploads one local file to several targets at once, reading it from disk only once.
+    channels maps each target to the SFTP channel to use for it.
+    Each target resumes from its own remote partial; the file is read from the
+    earliest offset any of them needs. Every target has its own bounded buffer, so a
+    slow one only falls behind until its buffer is full; if it then accepts nothing
+    for stall_timeout seconds it is given a TargetStalledError and the rest carry on.
+    Returns {target: None on success, or the exception it failed with}.
+    """
+    expected = _expected_remote_state(local_file, size, mtime)
+    results = {}
+    offsets = {}
+    for target, sftp in channels.items():
+        try:
+            offsets[target] = _open_remote_part(sftp, remote_file, expected)
+        except Exception as e:
+            results[target] = e
+    if not offsets:
+        return results
+
+    buffers = {target: queue_module.Queue(maxsize=FANOUT_BUFFER_CHUNKS) for target in offsets}
+    abandoned = {target: threading.Event() for target in offsets}
+
+    def run_worker(target):
+        try:
+            _send_to_target(target, channels[target], remote_file, expected, offsets[target], buffers[target], abandoned[target], cancel)
+            results.setdefault(target, None)
+        except Exception as e:
+            results.setdefault(target, e)
+            # Free the reader if it is waiting for room in this target's buffer.
+            try:
+                while True:
+                    buffers[target].get_nowait()
+            except queue_module.Empty:
+                pass
+
+    workers = {target: threading.Thread(target=tracer.profiled, args=(run_worker, target), name=f"Upload-{target.name}", daemon=True)
+               for target in offsets}
+    for worker in workers.values():
+        worker.start()
+
+    def hand_over(target, item):
+        deadline = time.monotonic() + stall_timeout
+        while True:
+            if cancel is not None:
+                cancel.check()
+            try:
+                buffers[target].put(item, timeout=min(0.5, max(deadline - time.monotonic(), 0.01)))
+                return True
+            except queue_module.Full:
+                if time.monotonic() >= deadline:
+                    results.setdefault(target, TargetStalledError(f"no progress for {stall_timeout} seconds"))
+                    abandoned[target].set()
+                    return False
+
+    live = set(offsets)
+    try:
+        start = min(offsets.values())
+        with open(local_file, 'rb') as local_f:
+            local_f.seek(start)
+            position = start
+            while live:
+                if cancel is not None:
+                    cancel.check()
+                chunk = local_f.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                for target in list(live):
+                    if target in results or (position + len(chunk) > offsets[target] and not hand_over(target, (position, chunk))):
+                        live.discard(target)
+                position += len(chunk)
+    except Exception as e:
+        # A local read error (or Stop) fails the file for every target still waiting on data.
+        for target in live:
+            results.setdefault(target, e)
+            abandoned[target].set()
+        live = set()
+
+    for target in live:
+        if target not in results:
+            hand_over(target, None)
+    for target, worker in workers.items():
+        if not abandoned[target].is_set():
+            worker.join(stall_timeout)
+            if worker.is_alive():
+                results.setdefault(target, TargetStalledError(f"no progress for {stall_timeout} seconds"))
+                abandoned[target].set()
+        if isinstance(results.get(target), TargetStalledError):
+            # Closing the channel frees a worker blocked on the stalled server.
+            channels[target].close()
+    return results
+
+def _channel_alive(sftp):
+    channel = sftp.get_channel()
+    transport = channel.get_transport() if channel else None
+    return bool(channel and not channel.closed and transport and transport.is_active())
+
+def _upload_entry(targets, entry, passphrase, cancel=None):
+    """
+    Uploads one plan entry to each of the targets over pooled channels and returns
+    {target: None on success, or the exception it failed with}. A target whose
+    channel died mid-file gets one more attempt on a fresh connection, resuming
+    from its remote partial.
+    """
+    channels = {}
+    results = {}
+    if cancel is not None and cancel.is_set():
+        return {target: TransferCancelled("Stopped by user.") for target in targets}
     try:
-        # Use the provided output_dir for the error log
-        error_log_file = os.path.join(output_dir, "upload_errors.txt")
+        for target in targets:
+            try:
+                channels[target] = target.acquire(passphrase)
+            except TargetUnreachableError as e:
+                results[target] = e
+        if len(channels) == 1 and len(targets) == 1:
+            target, sftp = next(iter(channels.items()))
+            try:
+                upload_file(sftp, entry.local_path, entry.remote_path, entry.size, entry.mtime, cancel)
+                results[target] = None
+            except Exception as e:
+                results[target] = e
+        elif channels:
+            results.update(fan_out_file(channels, entry.local_path, entry.remote_path, entry.size, entry.mtime, cancel=cancel))
 
-        if os.path.exists(error_log_file):
-            os.remove(error_log_file)
+        for target, error in list(results.items()):
+            if error is None or target not in channels or isinstance(error, (TargetStalledError, TransferCancelled)) or _channel_alive(channels[target]):
+                continue
+            sftp_pool.release(channels.pop(target), discard=True)
+            try:
+                channels[target] = target.acquire(passphrase)
+                upload_file(channels[target], entry.local_path, entry.remote_path, entry.size, entry.mtime, cancel)
+                results[target] = None
+            except Exception as e:
+                results[target] = e
+    finally:
+        for sftp in channels.values():
+            sftp_pool.release(sftp)
+    return results
 
+def perform_upload(local_source_path, queue, stop_event, passphrase, config_path, output_dir):
+    """
+    Uploads a directory over pooled SFTP connections, several files at a time,
+    sending progress to the GUI queue. With several SFTP_TARGETS configured, each
+    file is read once and sent to all of them concurrently.
+    """
+    error_count = 0
+    tracing = False
+    cancel = CancelToken(stop_event)
+    try:
         queue.put(("status", "Loading SFTP configuration..."))
         with open(config_path, 'r') as f:
             config = json.load(f)
-        
-        queue.put(("status", f"Connecting to {config['SFTP_HOSTNAME']}..."))
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(
-            hostname=config["SFTP_HOSTNAME"],
-            port=int(config.get("SFTP_PORT", 22)),
-            username=config["SFTP_USERNAME"],
-            key_filename=config["SFTP_PRIVATE_KEY_PATH"],
-            passphrase=passphrase,
-            timeout=15
-        )
-        sftp = client.open_sftp()
-        queue.put(("status", "SFTP Connection successful."))
+        tracing = tracer.start_from_config(config)
+        bandwidth_limiter.configure_from_config(config, queue)
+        upload_workers = int_from_config(config, "UPLOAD_WORKERS", DEFAULT_UPLOAD_WORKERS, queue, minimum=1)
+        transfer_order = transfer_order_from_config(config, queue)
+
+        targets = load_upload_targets(config, output_dir)
+        fan_out = len(targets) > 1
+        for target in targets:
+            if os.path.exists(target.error_log_file):
+                os.remove(target.error_log_file)
+
+        def report_target_failure(target, error):
+            target.mark_failed(str(error))
+            queue.put(("file_error", f"[{target.name}] Dropped from this upload: {error}"))
+            target.log_error(f"Dropped from this upload: {error}")
 
         remote_base_dir = os.path.basename(local_source_path)
-        
-        total_files = sum([len(files) for r, d, files in os.walk(local_source_path)])
-        queue.put(("status", f"Found {total_files} files to upload."))
-        
-        try:
-            sftp.stat(remote_base_dir)
-        except FileNotFoundError:
-            queue.put(("file_info", f"Creating remote directory: {remote_base_dir}"))
-            sftp.mkdir(remote_base_dir)
+
+        queue.put(("status", "Scanning local files..."))
+        with tracer.span("scan local files"):
+            plan = build_upload_plan(local_source_path, remote_base_dir)
+        total_files = plan.total_files
+        for local_path, error in plan.unreadable:
+            error_message = f"Skipped '{local_path}', which could not be read. Reason: {error}"
+            queue.put(("file_error", error_message))
+            for target in targets:
+                target.log_error(error_message)
+            error_count += 1
+
+        for target in targets:
+            queue.put(("status", f"Connecting to {target.settings['SFTP_HOSTNAME']}..."))
+            prefix = f"[{target.name}] " if fan_out else ""
+            try:
+                sftp = target.acquire(passphrase)
+            except TargetUnreachableError as e:
+                if not fan_out:
+                    raise e.__cause__
+                report_target_failure(target, e)
+                error_count += 1
+                continue
+            try:
+                for remote_dir in [remote_base_dir] + plan.directories:
+                    if stop_event.is_set():
+                        queue.put(("status", "Upload stopped by user."))
+                        queue.put(("stopped", (remote_base_dir, error_count)))
+                        return
+                    with tracer.span("ensure remote directory", "network", target=target.name, path=remote_dir):
+                        try:
+                            sftp.stat(remote_dir)
+                        except FileNotFoundError:
+                            kind = "directory" if remote_dir == remote_base_dir else "subdirectory"
+                            queue.put(("file_info", f"{prefix}Creating remote {kind}: {remote_dir}"))
+                            sftp.mkdir(remote_dir)
+            except Exception as e:
+                if not fan_out:
+                    raise
+                report_target_failure(target, e)
+                error_count += 1
+            finally:
+                sftp_pool.release(sftp)
+        if all(target.failed for target in targets):
+            raise ConnectionError("Could not connect to any SFTP target.")
+        queue.put(("status", "SFTP Connection successful."))
+        queue.put(("status", f"Found {total_files} files ({format_bytes(plan.total_bytes)}) to upload."))
 
         files_processed = 0
-        for root, dirs, files in os.walk(local_source_path):
-            if stop_event.is_set():
-                queue.put(("status", "Upload stopped by user."))
-                queue.put(("stopped", (remote_base_dir, error_count)))
-                return
-
-            for dir_name in dirs:
-                local_dir = os.path.join(root, dir_name)
-                relative_dir = os.path.relpath(local_dir, local_source_path)
-                remote_dir = f"{remote_base_dir}/{relative_dir.replace(os.path.sep, '/')}"
-                try:
-                    sftp.stat(remote_dir)
-                except FileNotFoundError:
-                    queue.put(("file_info", f"Creating remote subdirectory: {remote_dir}"))
-                    sftp.mkdir(remote_dir)
-            
-            for file_name in files:
-                if stop_event.is_set():
-                    queue.put(("status", "Upload stopped by user."))
-                    queue.put(("stopped", (remote_base_dir, error_count)))
-                    return
-                
-                files_processed += 1
-                queue.put(("progress", (files_processed, total_files)))
-                queue.put(("filename", f"Uploading: {file_name}"))
-
-                local_file = os.path.join(root, file_name)
-                relative_file = os.path.relpath(local_file, local_source_path)
-                remote_file = f"{remote_base_dir}/{relative_file.replace(os.path.sep, '/')}"
-                
-                try:
-                    sftp.put(local_file, remote_file)
-                except Exception as e:
-                    error_message = f"Failed to upload '{local_file}'. Reason: {e}"
-                    queue.put(("file_error", error_message))
-                    with open(error_log_file, "a", encoding='utf-8') as f:
-                        f.write(f"{datetime.now().isoformat()} - {error_message}\n")
-                    error_count += 1
-        
-        if not stop_event.is_set():
-            queue.put(("progress", (total_files, total_files)))
-            queue.put(("filename", "Upload complete."))
-            if error_count == 0:
-                queue.put(("status", "Upload completed successfully."))
-            else:
-                queue.put(("status", f"Upload completed with {error_count} errors."))
-            queue.put(("done", (remote_base_dir, error_count)))
+        in_flight = {}
+        scheduled_entries = order_by_size(plan.entries, lambda entry: entry.size, transfer_order)
+        meter = MakespanMeter(transfer_order, upload_workers, [entry.size for entry in plan.entries], [entry.size for entry in scheduled_entries])
+        entries = iter(scheduled_entries)
+        with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+            while True:
+                # Keep a few files queued ahead of the workers without submitting the whole plan.
+                while len(in_flight) < upload_workers * 2 and not stop_event.is_set():
+                    entry = next(entries, None)
+                    if entry is None:
+                        break
+                    active_targets = [target for target in targets if not target.failed]
+                    if not active_targets:
+                        raise ConnectionError("Every SFTP target has been dropped from this upload.")
+                    queue.put(("filename", f"Uploading: {os.path.basename(entry.local_path)}"))
+                    in_flight[executor.submit(tracer.profiled, meter.timed, entry.size, _upload_entry, active_targets, entry, passphrase, cancel)] = entry
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    entry = in_flight.pop(future)
+                    files_processed += 1
+                    queue.put(("progress", (files_processed, total_files)))
+                    for target, error in future.result().items():
+                        if error is None:
+                            target.files_done += 1
+                            continue
+                        if isinstance(error, TransferCancelled):
+                            # Not an error: the remote partial is resumed by the next upload.
+                            continue
+                        error_message = f"Failed to upload '{entry.local_path}'. Reason: {error}"
+                        queue.put(("file_error", f"[{target.name}] {error_message}" if fan_out else error_message))
+                        target.log_error(error_message)
+                        error_count += 1
+                        if fan_out and isinstance(error, (TargetStalledError, TargetUnreachableError)) and not target.failed:
+                            report_target_failure(target, error)
+                    if fan_out:
+                        queue.put(("target_progress", [(target.name, target.files_done, total_files, target.failed) for target in targets]))
+
+        if stop_event.is_set():
+            queue.put(("status", "Upload stopped by user."))
+            queue.put(("stopped", (remote_base_dir, error_count)))
+            return
+
+        queue.put(("progress", (total_files, total_files)))
+        queue.put(("filename", "Upload complete."))
+        schedule_summary = meter.summary()
+        if schedule_summary:
+            queue.put(("file_info", schedule_summary))
+        if fan_out:
+            for target in targets:
+                state = f"dropped ({target.failed})" if target.failed else f"{target.error_count} errors"
+                queue.put(("file_info", f"[{target.name}] {target.files_done} of {total_files} files uploaded, {state}."))
+        if error_count == 0:
+            queue.put(("status", "Upload completed successfully."))
+        else:
+            queue.put(("status", f"Upload completed with {error_count} errors."))
+        queue.put(("done", (remote_base_dir, error_count)))
 
     except Exception as e:
         queue.put(("error", str(e)))
     finally:
-        if sftp:
-            sftp.close()
-        if client:
-            client.close()
\ No newline at end of file
+        cancel.finish()
+        if tracing:
+            for trace_path in tracer.finish(output_dir, "upload"):
+                queue.put(("file_info", f"Trace written to '{trace_path}'."))
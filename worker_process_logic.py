@@ -0,0 +1,157 @@
+import os
+import json
+import queue
+import importlib
+import threading
+import multiprocessing
+
+from throttle_logic import bandwidth_limiter
+
+# Messages that end a job in the GUI's protocol.
+TERMINAL_MESSAGES = ("done", "stopped", "error", "preflight_done")
+RELAY_POLL_SECONDS = 0.2
+SHUTDOWN_GRACE_SECONDS = 5
+
+def _watch_parent(stop_event):
+    """Stops the running job and exits if the GUI process goes away without shutting us down."""
+    parent = multiprocessing.parent_process()
+    while parent is None or parent.is_alive():
+        threading.Event().wait(1)
+    stop_event.set()
+    threading.Event().wait(SHUTDOWN_GRACE_SECONDS)
+    os._exit(0)
+
+def _worker_main(commands, messages, stop_event):
+    """
+    Entry point of the worker process. Runs one transfer function at a time, passing it
+    the message queue and stop event in place of the GUI's own, and applies bandwidth
+    overrides sent from the GUI while it runs.
+    """
+    threading.Thread(target=_watch_parent, args=(stop_event,), name="ParentWatcher", daemon=True).start()
+    job = None
+    while True:
+        command = commands.get()
+        if command[0] == "shutdown":
+            stop_event.set()
+            if job:
+                job.join(SHUTDOWN_GRACE_SECONDS)
+            return
+        if command[0] == "bandwidth":
+            bandwidth_limiter.set_override(command[1])
+        elif command[0] == "run":
+            _, module_name, function_name, kwargs = command
+            function = getattr(importlib.import_module(module_name), function_name)
+            job = threading.Thread(target=_run_job, args=(function, kwargs, messages, stop_event), name="TransferJob", daemon=True)
+            job.start()
+
+def _run_job(function, kwargs, messages, stop_event):
+    try:
+        function(queue=messages, stop_event=stop_event, **kwargs)
+    except Exception as e:
+        messages.put(("error", f"{type(e).__name__} - {e}"))
+    finally:
+        # Lets the GUI skip the passphrase prompt for keys this process has already decrypted.
+        from sftp_pool_logic import sftp_pool
+        messages.put(("worker_keys", sftp_pool.unlocked_keys()))
+
+def transfers_in_process(config_path):
+    """Whether RUN_TRANSFERS_IN_PROCESS is turned on in the config file."""
+    try:
+        with open(config_path, 'r') as f:
+            value = json.load(f).get("RUN_TRANSFERS_IN_PROCESS")
+    except (OSError, ValueError):
+        return False
+    return str(value or "").strip().lower() in ("1", "true", "yes", "on")
+
+class TransferWorker:
+    """
+    Runs perform_download / perform_upload in a separate process, so CSV parsing,
+    hashing and SSH crypto don't compete with the window for the GIL. The process is
+    started on first use and kept for later jobs (keeping its SFTP connection pool).
+    Its messages are relayed into the GUI's queue unchanged, the GUI's stop event
+    and Speed Limits overrides are forwarded to it, and it exits on its own if the
+    window process dies.
+    """
+    def __init__(self, gui_queue, gui_stop_event):
+        self.gui_queue = gui_queue
+        self.gui_stop_event = gui_stop_event
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.job_running = False
+        self.unlocked_keys = set()
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self.commands = self.context.Queue()
+        self.messages = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.process = self.context.Process(target=_worker_main, args=(self.commands, self.messages, self.stop_event),
+                                            name="TransferWorker", daemon=True)
+        self.process.start()
+        self.sent_override = None
+        threading.Thread(target=self._relay, args=(self.process, self.messages), name="TransferRelay", daemon=True).start()
+
+    def run(self, module_name, function_name, **kwargs):
+        """Starts module_name.function_name(queue=..., stop_event=..., **kwargs) in the worker process."""
+        with self.lock:
+            self._ensure_started()
+            self.stop_event.clear()
+            self.job_running = True
+            self._forward_override()
+            self.commands.put(("run", module_name, function_name, kwargs))
+
+    def has_key(self, key_path):
+        try:
+            return (os.path.abspath(key_path), os.path.getmtime(key_path)) in self.unlocked_keys
+        except OSError:
+            return False
+
+    def _forward_override(self):
+        override = bandwidth_limiter.override
+        if override != self.sent_override:
+            self.sent_override = override
+            self.commands.put(("bandwidth", override))
+
+    def _relay(self, process, messages):
+        while True:
+            try:
+                message = messages.get(timeout=RELAY_POLL_SECONDS)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                return
+            if message is not None and message[0] == "worker_keys":
+                self.unlocked_keys = {tuple(key) for key in message[1]}
+            elif message is not None:
+                if message[0] in TERMINAL_MESSAGES:
+                    self.job_running = False
+                self.gui_queue.put(message)
+            with self.lock:
+                if process is not self.process:
+                    return
+                if message is None and not process.is_alive():
+                    if self.job_running:
+                        self.job_running = False
+                        self.gui_queue.put(("error", f"The transfer process stopped unexpectedly (exit code {process.exitcode})."))
+                    return
+                if self.gui_stop_event.is_set() and not self.stop_event.is_set():
+                    self.stop_event.set()
+                self._forward_override()
+
+    def shutdown(self, timeout=SHUTDOWN_GRACE_SECONDS):
+        """Stops any running job and ends the worker process, killing it if it doesn't exit in time."""
+        with self.lock:
+            process, self.process = self.process, None
+            if process is None:
+                return
+            self.stop_event.set()
+            try:
+                self.commands.put(("shutdown",))
+            except (OSError, ValueError):
+                pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join(1)
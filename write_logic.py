@@ -0,0 +1,220 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from trace_logic import tracer
+from cancel_logic import CANCEL_POLL_SECONDS
+
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+# How many bytes network workers may hand over before they block waiting for the disk.
+MAX_BUFFERED_BYTES = 128 * 1024 * 1024
+
+class LocalWriter:
+    """
+    A write-behind stage that owns local disk I/O for a download job. Network workers
+    hand it chunks through a bounded in-memory buffer and carry on reading, while a
+    single background thread creates directories (remembering which already exist),
+    preallocates files of known size, writes through large buffers and optionally
+    fsyncs finished files in batches.
+
+    Operations for the same file run in the order they were submitted. Anything that
+    has to happen after a file's data is written (a sidecar update, the final rename)
+    is passed in as a callable and reported back through a Future.
+    """
+    def __init__(self, fsync_batch_size=0, max_buffered_bytes=MAX_BUFFERED_BYTES):
+        self.fsync_batch_size = fsync_batch_size
+        self.max_buffered_bytes = max_buffered_bytes
+        self._ops = deque()
+        self._buffered_bytes = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._known_dirs = set()
+        self._handles = {}
+        self._errors = {}
+        self._unsynced = []
+        self._deferred = []
+        self._thread = threading.Thread(target=self._run, name="LocalWriter", daemon=True)
+        self._thread.start()
+
+    # --- Called from network threads ---
+
+    def _enqueue(self, op, size=0, cancel=None):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The local writer has been shut down.")
+            while size and self._buffered_bytes and self._buffered_bytes + size > self.max_buffered_bytes:
+                if cancel is None:
+                    self._condition.wait()
+                    continue
+                # Wake up regularly so Stop is noticed even while the disk is behind.
+                self._condition.wait(CANCEL_POLL_SECONDS)
+                cancel.check()
+            self._ops.append(op)
+            self._buffered_bytes += size
+            self._condition.notify_all()
+
+    def open(self, file_path, size=None, resume=False):
+        """Creates (or, with resume, reopens) file_path, preallocating it if size is known."""
+        self._enqueue(("open", file_path, size, resume))
+
+    def write(self, file_path, offset, data, cancel=None):
+        """
+        Queues data for file_path at offset. Blocks only while the buffer is full; with
+        a CancelToken, Stop ends that wait with TransferCancelled.
+        """
+        self._enqueue(("write", file_path, offset, data), len(data), cancel)
+
+    def submit(self, fn, *args, file_path=None, close=False):
+        """
+        Runs fn(*args) on the writer thread once everything queued before it has been
+        handled. If file_path is given, that file's buffered data is flushed first
+        (and with close=True, its handle closed and any write error raised). The
+        returned Future holds fn's result or exception.
+        """
+        future = Future()
+        self._enqueue(("call", file_path, close, fn, args, future))
+        return future
+
+    def abort(self, file_path):
+        """Flushes and closes file_path after an interrupted transfer, leaving it on disk."""
+        self._enqueue(("abort", file_path))
+
+    def shutdown(self):
+        """Processes everything still queued, syncs and closes all files, and stops the thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    # --- Writer thread ---
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._ops and not self._closed:
+                    if self._unsynced or self._deferred:
+                        break
+                    self._condition.wait()
+                if not self._ops and self._closed:
+                    break
+                op = self._ops.popleft() if self._ops else None
+            if op is None:
+                # Idle: a good moment to sync whatever has finished so far.
+                self._sync_batch()
+                continue
+            try:
+                # Finishing steps are named after the function they run, e.g. write_sidecar.
+                span_name = getattr(op[3], "__name__", "call") if op[0] == "call" else op[0]
+                with tracer.span(span_name, "disk", path=op[1]):
+                    self._handle(op)
+            finally:
+                if op[0] == "write":
+                    with self._condition:
+                        self._buffered_bytes -= len(op[3])
+                        self._condition.notify_all()
+            if self.fsync_batch_size and len(self._deferred) >= self.fsync_batch_size:
+                self._sync_batch()
+        for file_path in list(self._handles):
+            self._close_handle(file_path)
+        self._sync_batch()
+
+    def _ensure_dir(self, dir_path):
+        if dir_path and dir_path not in self._known_dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            self._known_dirs.add(dir_path)
+
+    def _handle(self, op):
+        kind, file_path = op[0], op[1]
+        if kind == "open":
+            _, _, size, resume = op
+            self._errors.pop(file_path, None)
+            try:
+                self._ensure_dir(os.path.dirname(file_path))
+                f = open(file_path, "r+b" if resume else "w+b", buffering=WRITE_BUFFER_SIZE)
+                if size and not resume:
+                    _preallocate(f, size)
+                self._handles[file_path] = f
+            except Exception as e:
+                self._errors[file_path] = e
+        elif kind == "write":
+            _, _, offset, data = op
+            f = self._handles.get(file_path)
+            if f is None:
+                return
+            try:
+                if f.tell() != offset:
+                    f.seek(offset)
+                f.write(data)
+            except Exception as e:
+                self._errors.setdefault(file_path, e)
+        elif kind == "call":
+            _, _, close, fn, args, future = op
+            try:
+                if file_path is not None:
+                    self._ensure_dir(os.path.dirname(file_path))
+                    if close:
+                        self._close_handle(file_path)
+                        if file_path in self._errors:
+                            raise self._errors.pop(file_path)
+                    elif file_path in self._handles:
+                        self._handles[file_path].flush()
+            except Exception as e:
+                future.set_exception(e)
+                return
+            if close and self.fsync_batch_size:
+                # Finishing steps such as the final rename wait until the data is synced.
+                self._deferred.append((fn, args, future))
+            else:
+                _run_call(fn, args, future)
+        elif kind == "abort":
+            self._close_handle(file_path)
+            self._errors.pop(file_path, None)
+
+    def _close_handle(self, file_path):
+        f = self._handles.pop(file_path, None)
+        if f is None:
+            return
+        try:
+            f.flush()
+            if self.fsync_batch_size:
+                self._unsynced.append(os.dup(f.fileno()))
+        except Exception as e:
+            self._errors.setdefault(file_path, e)
+        finally:
+            f.close()
+
+    def _sync_batch(self):
+        if self._unsynced:
+            with tracer.span("fsync batch", "disk", files=len(self._unsynced)):
+                self._fsync_unsynced()
+        deferred, self._deferred = self._deferred, []
+        for fn, args, future in deferred:
+            _run_call(fn, args, future)
+
+    def _fsync_unsynced(self):
+        for fd in self._unsynced:
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+        self._unsynced = []
+
+def _run_call(fn, args, future):
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+
+def _preallocate(f, size):
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    f.truncate(size)